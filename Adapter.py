@@ -18,6 +18,24 @@
     It acts as a bridge between the client code and the Adaptee, translating the client's 
     requests into calls that Adaptee can understand.
 """
+
+import array
+import itertools
+import mmap
+import operator
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+try:
+	import numpy #Optional: makes convert_many() a vectorized, allocation-free kernel
+except ImportError:
+	numpy = None
+
 class Korean:
 	"""Korean speaker"""
 	def __init__(self):
@@ -68,6 +86,74 @@ for obj in objects:
 	print("{} says '{}'\n".format(obj.name, obj.speak()))
 
 
+"""Compiled adapters:
+    Adapter keeps the mapped methods in each instance's __dict__ and sends every other
+    attribute through __getattr__, which costs a Python call on every access. The
+    adapter_class() factory below builds one adapter class per (adaptee class, mapping)
+    instead, and caches it. The class uses __slots__: renamed and passthrough methods
+    are bound once per adapter and stored in a slot, and data attributes get a property
+    whose getter is a C-level attrgetter, so both kinds of access run at close to native
+    speed. Anything the class doesn't know about still falls back to __getattr__."""
+
+_adapter_classes = {} #(adaptee class, mapping, passthrough) -> adapter class
+
+def _forward(target):
+	"""Property that reads (and writes) `target` on the adapted object"""
+	def set_target(self, value):
+		setattr(self._object, target, value)
+	return property(operator.attrgetter("_object." + target), set_target)
+
+def _forward_missing(self, attr):
+	"""Simply return the rest of attributes!"""
+	return getattr(self._object, attr)
+
+def adapter_class(adaptee_class, passthrough=(), **adapted_methods):
+	"""Return the adapter class for adaptee_class, creating it the first time
+
+	adapted_methods maps the new name to the adaptee's attribute name, e.g. speak="speak_korean".
+	Public class attributes are forwarded automatically; instance attributes (set in __init__)
+	are only known if listed in passthrough."""
+	key = (adaptee_class, tuple(sorted(adapted_methods.items())), tuple(passthrough))
+	cls = _adapter_classes.get(key)
+	if cls is None:
+		names = {name: name for name in dir(adaptee_class) if not name.startswith("_")}
+		names.update((name, name) for name in passthrough)
+		names.update(adapted_methods)
+
+		#Methods are bound once per adapter and kept in a slot; data attributes are properties,
+		#so they always show the adaptee's current value
+		methods = {name: target for name, target in names.items() if callable(getattr(adaptee_class, target, None))}
+		attributes = {"__slots__": ("_object",) + tuple(methods), "__getattr__": _forward_missing}
+		for name, target in names.items():
+			if name not in methods:
+				attributes[name] = _forward(target)
+
+		def __init__(self, adaptee):
+			self._object = adaptee
+			for name, target in methods.items():
+				setattr(self, name, getattr(adaptee, target))
+		attributes["__init__"] = __init__
+
+		cls = type(adaptee_class.__name__ + "Adapter", (object,), attributes)
+		_adapter_classes[key] = cls
+	return cls
+
+def compiled_adapter(adaptee, passthrough=(), **adapted_methods):
+	"""Like Adapter(adaptee, speak=adaptee.speak_korean), but with method names: speak="speak_korean" """
+	return adapter_class(type(adaptee), passthrough, **adapted_methods)(adaptee)
+
+compiled_objects = [
+	compiled_adapter(korean, passthrough=("name",), speak="speak_korean"),
+	compiled_adapter(british, passthrough=("name",), speak="speak_english"),
+]
+
+for obj in compiled_objects:
+	print("{} says '{}' through {}\n".format(obj.name, obj.speak(), type(obj).__name__))
+
+#Every Korean adapted the same way shares one class
+print(type(compiled_adapter(Korean(), passthrough=("name",), speak="speak_korean")) is type(compiled_objects[0])) #True
+
+
 """ChayGPT Example:
     Let's consider a simple example of a temperature converter application
     that converts temperatures between Celsius and Fahrenheit. We have an 
@@ -81,6 +167,31 @@ class TemperatureConverter:
     def convert(self, value):
         pass
 
+    def convert_many(self, values, out=None):
+        """Convert a whole buffer of values (array.array, NumPy array, memoryview, ...).
+        Results go into `out` (a writable buffer of 'd' or 'f' values) if given, else into a new
+        array('d'). This default calls convert() once per value; adapters may override it with a
+        batch version, which must keep to the same contract."""
+        results = array.array("d", map(self.convert, memoryview(values)))
+        return _store(results, out)
+
+_OUT_FORMATS = ("d", "f")  # What convert_many() can write into: doubles or floats
+
+def _out_view(out):
+    """memoryview of the caller's output buffer, checked to hold doubles or floats"""
+    view = memoryview(out)
+    if view.format not in _OUT_FORMATS:
+        raise TypeError("out must be a writable buffer of 'd' or 'f' values, not {!r}".format(view.format))
+    return view
+
+def _store(results, out):
+    """Copy results (an array('d')) into the caller's buffer (if any) and return where they ended up"""
+    if out is None:
+        return results
+    view = _out_view(out)
+    view[:] = results if view.format == results.typecode else array.array(view.format, results)
+    return out
+
 # Adaptee with an incompatible interface
 class CelsiusTemperature:
     def get_temperature(self):
@@ -97,6 +208,27 @@ class CelsiusToFahrenheitAdapter(TemperatureConverter):
         # Convert Celsius to Fahrenheit and return
         return (celsius_value * 9/5) + 32
 
+    def convert_many(self, celsius_values, out=None):
+        """Same formula as convert() and the same contract as TemperatureConverter.convert_many().
+        With NumPy it is three in-place ufuncs over the whole buffer, which is where the speed-up
+        is. Without NumPy it chains map()s: that only saves the convert() call per value, which has
+        measured anywhere from no gain to about a third faster than the default loop, so it is not
+        a vectorized path."""
+        if numpy is not None:
+            celsius = numpy.asarray(celsius_values, dtype=numpy.float64) #No copy for float64 buffers
+            if out is None:
+                out = array.array("d", bytes(8 * len(celsius)))
+            view = _out_view(out)
+            fahrenheit = numpy.frombuffer(view, dtype=view.format) #A view on the caller's buffer, written in place
+            numpy.multiply(celsius, 9, out=fahrenheit)
+            numpy.divide(fahrenheit, 5, out=fahrenheit)
+            numpy.add(fahrenheit, 32, out=fahrenheit)
+            return out
+
+        scaled = map(operator.truediv, map(operator.mul, memoryview(celsius_values), itertools.repeat(9)), itertools.repeat(5))
+        results = array.array("d", map(operator.add, scaled, itertools.repeat(32)))
+        return _store(results, out)
+
 # Client code
 if __name__ == "__main__":
     # Creating an instance of Adaptee (CelsiusTemperature)
@@ -108,6 +240,12 @@ if __name__ == "__main__":
     celsius_value = 25
     fahrenheit_value = converter.convert(celsius_value)
     print(f"{celsius_value} Celsius is equal to {fahrenheit_value} Fahrenheit")
+
+    # Whole batches of readings at once, written into a buffer we already have
+    readings = array.array("d", [-40, 0, 37, 100])
+    fahrenheit_values = array.array("d", bytes(8 * len(readings)))
+    converter.convert_many(readings, out=fahrenheit_values)
+    print(f"{list(readings)} Celsius is equal to {list(fahrenheit_values)} Fahrenheit")
     
 """In this example, TemperatureConverter is the target interface that the client code expects
     to use for temperature conversion. CelsiusTemperature is the Adaptee with an incompatible interface,
@@ -116,4 +254,195 @@ if __name__ == "__main__":
     the adapter translates the client's request for Fahrenheit conversion into the corresponding Celsius 
     temperature from the Adaptee and then converts it to Fahrenheit. The client code works with the 
     TemperatureConverter interface, allowing seamless temperature conversion using the existing 
-    CelsiusTemperature class without modifying its original interface."""
\ No newline at end of file
+    CelsiusTemperature class without modifying its original interface."""
+
+
+"""Streaming conversion:
+    Files of readings that are too big for memory are converted chunk by chunk.
+    The input is memory-mapped; a reader thread cuts it into chunks (and parses them,
+    for CSV) while the main thread converts the previous chunk with convert_many()
+    into a buffer that is reused for every chunk and writes it out in one go. Memory
+    use depends on chunk_bytes and depth, not on the size of the file."""
+
+def _read_chunks(source, fmt, typecode, chunk_bytes, chunks, stop):
+	"""Reader thread: puts chunks (or an exception) in the queue, then None at the end.
+	Stops early once `stop` is set (the main thread failed and won't want the rest)."""
+	try:
+		with open(source, "rb") as f:
+			if os.fstat(f.fileno()).st_size == 0:
+				return
+			with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+				if fmt == "binary":
+					itemsize = array.array(typecode).itemsize
+					step = max(chunk_bytes // itemsize, 1) * itemsize #Never cut a value in half
+					view = memoryview(mm)
+					try:
+						for start in range(0, len(mm), step):
+							if stop.is_set():
+								break
+							with view[start:start + step] as piece:
+								if hasattr(mm, "madvise"):
+									page = start - start % mmap.PAGESIZE
+									mm.madvise(mmap.MADV_WILLNEED, page, start + len(piece) - page) #Start reading it from disk now
+								chunks.put((len(piece), piece.cast(typecode)))
+						chunks.join() #The main thread must be done with our views before the map is closed
+					finally:
+						view.release()
+				else:
+					start = 0
+					while start < len(mm) and not stop.is_set():
+						end = mm.find(b"\n", min(start + chunk_bytes, len(mm)) - 1) #Only cut between lines
+						end = len(mm) if end == -1 else end + 1
+						text = mm[start:end].replace(b",", b" ")
+						chunks.put((end - start, array.array(typecode, map(float, text.split()))))
+						start = end
+	except BaseException as e:
+		chunks.put(e)
+	finally:
+		chunks.put(None)
+
+def stream_convert(converter, source, target, fmt="binary", typecode="d", chunk_bytes=4 * 1024 * 1024, depth=2):
+	"""Convert a file of readings with converter.convert_many(), chunk by chunk, with constant memory.
+
+	fmt is "binary" (packed values of array typecode `typecode`, output in the same format)
+	or "csv" (one or more comma/space separated readings per line, output one per line).
+	Returns the number of values and bytes read, the time taken and the throughput in MB/s."""
+	if fmt not in ("binary", "csv"):
+		raise ValueError("fmt must be 'binary' or 'csv', not {!r}".format(fmt))
+
+	if fmt == "binary":
+		itemsize = array.array(typecode).itemsize
+		size = os.path.getsize(source)
+		if size % itemsize:
+			raise ValueError("{} holds {} bytes, which is not a whole number of {}-byte {!r} values".format(
+				source, size, itemsize, typecode))
+
+	chunks = queue.Queue(maxsize=depth) #Bounded: the reader can only get `depth` chunks ahead
+	stop = threading.Event()
+	reader = threading.Thread(target=_read_chunks, args=(source, fmt, typecode, chunk_bytes, chunks, stop), daemon=True)
+	out = array.array(typecode) #Output buffer, grown once and then reused for every chunk
+	values = read = 0
+	current = None #Binary chunk taken off the queue and not finished with yet
+
+	start = time.perf_counter()
+	reader.start()
+	try:
+		with open(target, "wb") as f:
+			while True:
+				item = chunks.get()
+				if item is None:
+					break
+				if isinstance(item, BaseException):
+					raise item
+				size, chunk = item
+				count = len(chunk)
+				if fmt == "binary":
+					current = chunk
+				if len(out) < count:
+					out.extend(itertools.repeat(0, count - len(out)))
+				with memoryview(out) as buffer, buffer[:count] as result:
+					converter.convert_many(chunk, out=result)
+					if fmt == "binary":
+						f.write(result) #Straight from the buffer, no copy
+						current = None
+						chunk.release()
+						chunks.task_done()
+					else:
+						f.write("\n".join(map(repr, result)).encode() + b"\n")
+				values += count
+				read += size
+	except BaseException:
+		#Don't leave the reader blocked in put() or join() with the file mapped: stop it, and hand
+		#back everything it queued so that it can close the map and end
+		stop.set()
+		if current is not None:
+			current.release()
+			chunks.task_done()
+		while reader.is_alive():
+			try:
+				item = chunks.get(timeout=0.05)
+			except queue.Empty:
+				continue
+			if isinstance(item, tuple) and fmt == "binary":
+				item[1].release()
+			chunks.task_done()
+		raise
+	finally:
+		reader.join()
+	elapsed = time.perf_counter() - start
+	return {"values": values, "bytes": read, "seconds": elapsed,
+	        "mb_per_s": read / (1024 * 1024) / elapsed if elapsed else float("inf")}
+
+if __name__ == "__main__":
+	with tempfile.TemporaryDirectory() as tmp:
+		source, target = os.path.join(tmp, "celsius.csv"), os.path.join(tmp, "fahrenheit.csv")
+		with open(source, "w") as f:
+			f.write("-40\n0\n37,100\n")
+		stream_convert(converter, source, target, fmt="csv")
+		with open(target) as f:
+			print("Streamed: {}".format(f.read().split()))
+
+
+def benchmark_adapters(count=10000, repeat=20):
+	"""Attribute access cost over `count` adapted objects: Adapter vs compiled_adapter()"""
+	speakers = [Korean() if i % 2 else British() for i in range(count)]
+	methods = {"Korean": "speak_korean", "British": "speak_english"}
+	plain = [Adapter(s, speak=getattr(s, methods[s.name])) for s in speakers]
+	compiled = [compiled_adapter(s, passthrough=("name",), speak=methods[s.name]) for s in speakers]
+
+	def renamed(objects):
+		return lambda: [obj.speak for obj in objects]
+
+	def passthrough(objects):
+		return lambda: [obj.name for obj in objects]
+
+	for label, objects in (("Adapter", plain), ("compiled_adapter", compiled)):
+		for kind, make in (("renamed (speak)", renamed), ("passthrough (name)", passthrough)):
+			best = min(timeit.repeat(make(objects), number=repeat, repeat=3))
+			print("{:16} {:18}: {:.1f} ns per access".format(label, kind, best / (count * repeat) * 1e9))
+
+def benchmark_convert_many(count=1000000):
+	"""convert() in a loop vs convert_many() into a preallocated buffer"""
+	converter = CelsiusToFahrenheitAdapter(CelsiusTemperature())
+	readings = array.array("d", (i % 100 for i in range(count)))
+	out = array.array("d", bytes(8 * count))
+	runs = (("convert() per value", lambda: [converter.convert(value) for value in readings]),
+	        ("convert_many(out=...)", lambda: converter.convert_many(readings, out=out)))
+	for label, run in runs:
+		best = min(timeit.repeat(run, number=1, repeat=3))
+		print("{:22}: {:.1f} ns per reading{}".format(label, best / count * 1e9, "" if numpy else " (without NumPy)"))
+
+def benchmark_stream_convert(binary_mb=512, csv_mb=64):
+	"""Throughput of stream_convert() on binary and CSV files vs converting a CSV line by line"""
+	converter = CelsiusToFahrenheitAdapter(CelsiusTemperature())
+	with tempfile.TemporaryDirectory() as tmp:
+		binary, csv, target = (os.path.join(tmp, name) for name in ("celsius.bin", "celsius.csv", "out"))
+		block = array.array("d", (i % 1000 / 10 for i in range(128 * 1024))) #1 MB of doubles
+		with open(binary, "wb") as f:
+			for _ in range(binary_mb):
+				f.write(block)
+		lines = "".join("{!r}\n".format(value) for value in block).encode()
+		with open(csv, "wb") as f:
+			while f.tell() < csv_mb * 1024 * 1024:
+				f.write(lines)
+
+		def line_by_line():
+			start = time.perf_counter()
+			with open(csv) as source, open(target, "w") as out:
+				for line in source:
+					out.write("{!r}\n".format(converter.convert(float(line))))
+			elapsed = time.perf_counter() - start
+			return {"mb_per_s": os.path.getsize(csv) / (1024 * 1024) / elapsed, "seconds": elapsed}
+
+		runs = (("CSV line by line", line_by_line),
+		        ("CSV streamed", lambda: stream_convert(converter, csv, target, fmt="csv")),
+		        ("binary streamed", lambda: stream_convert(converter, binary, target)))
+		for label, run in runs:
+			stats = run()
+			print("{:16}: {:7.1f} MB/s ({:.2f}s){}".format(label, stats["mb_per_s"], stats["seconds"], "" if numpy else " (without NumPy)"))
+
+# Benchmark (run with: python Adapter.py --bench)
+if __name__ == "__main__" and "--bench" in sys.argv:
+	benchmark_adapters()
+	benchmark_convert_many()
+	benchmark_stream_convert()
@@ -22,23 +22,39 @@
     This is the class that initiates the request and starts the chain.
     The client is unaware of which handler will process the request."""
 
+import sys
+import timeit
+from bisect import bisect_left
+from collections import namedtuple
+
+Range = namedtuple("Range", "low high") #A handler declaring accepts = Range(low, high) handles exactly low < request <= high
+
 class Handler: #Abstract handler
 	"""Abstract Handler"""
+	accepts = None # Range of requests this handler takes, None if only _handle knows
+
 	def __init__(self, successor):
 		self._successor = successor # Define who is the next handler
 
 	def handle(self, request):
-			handled = self._handle(request) #If handled, stop here
+		handler = self
+		while handler is not None: #A loop rather than recursion, so long chains don't hit the recursion limit
+			if handler._handle(request): #If handled, stop here
+				return True
+			handler = handler._successor #Otherwise, keep going
+		return False
 
-			#Otherwise, keep going
-			if not handled:
-				self._successor.handle(request)	
+	def compile(self):
+		"""Routing table for the chain starting here (compile again after changing the chain)"""
+		return RoutedChain(self)
 
 	def _handle(self, request):
 		raise NotImplementedError('Must provide implementation in subclass!')
 
 class ConcreteHandler1(Handler): # Inherits from the abstract handler
 	"""Concrete handler 1"""
+	accepts = Range(0, 10) # The same condition as below, declared so the chain can be routed
+
 	def _handle(self, request):
 		if 0 < request <= 10: # Provide a condition for handling
 			print("Request {} handled in handler 1".format(request))
@@ -53,10 +69,51 @@ class DefaultHandler(Handler): # Inherits from the abstract handler
 		print("End of chain, no handler for {}".format(request))
 		return True # Indicates that the request has been handled
 
+class RoutedChain:
+	"""A compiled chain: bisect finds the first handler whose range holds the request,
+	only the handlers without a declared range in front of it are still asked in turn"""
+
+	def __init__(self, first):
+		self.first = first
+		chain = []
+		handler = first
+		while handler is not None:
+			chain.append(handler)
+			handler = handler._successor
+
+		ranged = [(position, handler.accepts) for position, handler in enumerate(chain) if handler.accepts is not None]
+		opaque = [position for position, handler in enumerate(chain) if handler.accepts is None]
+		#Cut the keys into intervals (bounds[j - 1], bounds[j]] so that each lies in or outside every range
+		self.bounds = sorted({bound for _, accepts in ranged for bound in accepts})
+		owner = [None] * (len(self.bounds) + 1) #Position of the first handler whose range covers each interval
+		for position, (low, high) in ranged:
+			for interval in range(bisect_left(self.bounds, low) + 1, bisect_left(self.bounds, high) + 1):
+				if owner[interval] is None:
+					owner[interval] = position
+
+		#Per interval: the handlers to ask, in chain order, and where the walk goes on if none of them takes it
+		self.routes = []
+		for position in owner:
+			if position is None:
+				self.routes.append((tuple(chain[index] for index in opaque), None))
+			else:
+				asked = tuple(chain[index] for index in opaque if index < position) + (chain[position],)
+				self.routes.append((asked, chain[position]._successor))
+
+	def handle(self, request):
+		try:
+			handlers, rest = self.routes[bisect_left(self.bounds, request)]
+		except TypeError: #Not comparable with the ranges: only the handlers themselves can tell
+			return self.first.handle(request)
+		for handler in handlers:
+			if handler._handle(request):
+				return True
+		return rest.handle(request) if rest is not None else False #The chosen handler declined after all
+
 class Client: # Using handlers
 	def __init__(self):
-		self.handler = ConcreteHandler1(DefaultHandler(None)) # Create handlers and use them in a sequence you want
-		                                                      # Note that the default handler has no successor
+		self.handler = ConcreteHandler1(DefaultHandler(None)).compile() # Create handlers and use them in a sequence you want
+		                                                                # Note that the default handler has no successor
 
 	def delegate(self, requests): # Send your requests one at a time for handlers to handle
 		for request in requests:
@@ -70,3 +127,61 @@ requests = [2, 5, 30]
 
 # Send the requests
 c.delegate(requests)
+
+class BandHandler(Handler):
+	"""Handler for one band of requests, counting instead of printing"""
+	def __init__(self, successor, low, high):
+		super().__init__(successor)
+		self.accepts = Range(low, high)
+		self.handled = 0
+
+	def _handle(self, request):
+		if self.accepts.low < request <= self.accepts.high:
+			self.handled += 1
+			return True
+
+class NegativeEvenHandler(Handler):
+	"""Handler for negative even integers, a condition that can't be written as a range"""
+	def __init__(self, successor):
+		super().__init__(successor)
+		self.handled = 0
+
+	def _handle(self, request):
+		if isinstance(request, int) and request % 2 == 0 and request < 0:
+			self.handled += 1
+			return True
+
+def band_chain(count, width=10):
+	"""count bands of the given width, an opaque handler in the middle and a default handler at the end"""
+	handler = DefaultHandler(None)
+	for index in reversed(range(count)):
+		handler = BandHandler(handler, index * width, (index + 1) * width)
+		if index == count // 2:
+			handler = NegativeEvenHandler(handler)
+	return handler
+
+#A chain far longer than the recursion limit still works, walked or routed
+long_chain = band_chain(sys.getrecursionlimit() * 2)
+routed_chain = long_chain.compile()
+for request in (15000, 15000.5, -4):
+	long_chain.handle(request)
+	routed_chain.handle(request)
+handler = long_chain
+while handler is not None:
+	if getattr(handler, "handled", 0):
+		print("{} {} handled {} requests".format(type(handler).__name__, handler.accepts, handler.handled))
+	handler = handler._successor
+
+def benchmark_routed_chain(sizes=(10, 100, 1000), requests=2000):
+	"""Requests spread over the chain: linear walk against the compiled routing table"""
+	for size in sizes:
+		chain = band_chain(size)
+		routed = chain.compile()
+		keys = [(index * 7919) % (size * 10) + 0.5 for index in range(requests)]
+		walk = min(timeit.repeat(lambda: [chain.handle(key) for key in keys], number=1, repeat=3)) / requests
+		route = min(timeit.repeat(lambda: [routed.handle(key) for key in keys], number=1, repeat=3)) / requests
+		print("{:5} handlers: linear walk {:8.2f} us | routed {:5.2f} us per request".format(size, walk * 1e6, route * 1e6))
+
+# Benchmark (run with: python Chain..py --bench)
+if __name__ == "__main__" and "--bench" in sys.argv:
+	benchmark_routed_chain()
@@ -23,31 +23,304 @@
     call the update method of all registered observers to notify them."""
 
 
+import asyncio
+import bisect
+import collections
+import contextlib
+import copy
+import inspect
+import itertools
+import multiprocessing
+import operator
+import random
+import statistics
+import struct
+import sys
+import threading
+import time
+import timeit
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+
 class Subject(object): #Represents what is being 'observed'
 
-	def __init__(self):
-		self._observers = [] # This where references to all the observers are being kept
+	def __init__(self, weak=False):
+		self._weak = weak # With weak=True, observers that nobody else references any more are dropped automatically
+		self._observers = {} # This where references to all the observers are being kept, by id() and in the order they were attached
 							 # Note that this is a one-to-many relationship: there will be one subject to be observed by multiple _observers
+		self._fanout = None # Set by enable_async(): observers are then notified through their own queues
+		self._batch_depth = 0 # > 0 inside batch(): notify() only remembers that something changed
+		self._batched = None # (modifier,) of the latest notify() held back by batch()
+		self._window = None # ("throttle" or "debounce", seconds) set by throttle()/debounce()
+		self._pending = None # (modifier,) of the latest notify() held back by the window
+		self._last_sent = float("-inf")
+		self._deadline = 0.0
+		self._timer = None
+		self._timer_id = 0 # Which _schedule() call the current timer comes from
+		self._rate_lock = threading.Lock()
+		self._delivery_lock = threading.RLock() # One throttled/debounced delivery at a time, whichever thread makes it
+		self._conditions = None # ConditionIndex of the observers that subscribe() to conditions
+		self._indexed_last = None # Value the conditions were last checked against (for Crosses)
+		self._value_of = None # Callable giving the value for conditions and publish_to(), e.g. operator.attrgetter("temp")
+		self._ring = None # RingBuffer that publish_to() sends every change to, for other processes
+		self._stats = None # NotifyStats while instrument()ed
 
 	def attach(self, observer):
-		if observer not in self._observers: #If the observer is not already in the observers list
-			self._observers.append(observer) # append the observer to the list
+		key = id(observer)
+		if key not in self._observers: #If the observer is not already attached (a dict lookup, not a scan of the whole list)
+			if self._weak:
+				self._observers[key] = weakref.ref(observer, self._forget(key))
+			else:
+				self._observers[key] = observer
+
+	@staticmethod
+	def _forget_observer(subject_ref, key, ref):
+		subject = subject_ref()
+		if subject is not None and subject._observers.get(key) is ref: # Only if the id() hasn't been reused since
+			del subject._observers[key]
+			if subject._fanout is not None:
+				subject._fanout.forget(key) # Its queue and consumer task go too
+
+	def _forget(self, key):
+		"""Callback that detaches a collected observer (it only holds a weak reference to the subject)"""
+		subject_ref = weakref.ref(self)
+		return lambda ref: Subject._forget_observer(subject_ref, key, ref)
 
 	def detach(self, observer): #Simply remove the observer
+		self._observers.pop(id(observer), None)
+		if self._fanout is not None:
+			self._fanout.discard(observer)
+
+	def observers(self):
+		"""The attached observers that are still alive, in the order they were attached"""
+		if self._weak:
+			return [observer for observer in (ref() for ref in self._observers.values()) if observer is not None]
+		return list(self._observers.values())
+
+	@property
+	def observer_count(self):
+		"""How many observers are attached (no __len__: a subject without observers is still truthy)"""
+		return len(self._observers)
+
+	def enable_async(self, maxsize=100, policy="drop-oldest"):
+		"""From now on, notify() only queues the update: every observer gets its own bounded queue
+		and asyncio task that calls its update(). Returns the AsyncFanout (for stats() and drain())."""
 		try:
-			self._observers.remove(observer)
-		except ValueError:
-			pass
+			asyncio.get_running_loop()
+		except RuntimeError:
+			raise RuntimeError("enable_async() needs a running event loop: call it from async code") from None
+		self._fanout = AsyncFanout(self, maxsize, policy)
+		return self._fanout
+
+	def disable_async(self):
+		"""Notify observers directly again. Updates still queued are dropped: drain() the fan-out first to deliver them."""
+		if self._fanout is not None:
+			self._fanout.close()
+
+	async def notify_async(self, modifier=None):
+		"""Like notify(), but with policy "block" it waits until every queue has room"""
+		if self._fanout is not None:
+			await self._fanout.publish_wait(modifier)
+		else:
+			self.notify(modifier)
+
+	@contextlib.contextmanager
+	def batch(self):
+		"""Inside `with subject.batch():` any number of changes cause a single notify() at the end"""
+		self._batch_depth += 1
+		try:
+			yield self
+		finally:
+			self._batch_depth -= 1
+			if not self._batch_depth and self._batched is not None:
+				(modifier,), self._batched = self._batched, None
+				self.notify(modifier)
+
+	def throttle(self, interval):
+		"""Notify at most once per `interval` seconds: right away if the last notification is older,
+		otherwise once at the end of the window with the latest state. None turns it off."""
+		self._set_window("throttle", interval)
+
+	def debounce(self, interval):
+		"""Notify only once the subject has been quiet for `interval` seconds. None turns it off."""
+		self._set_window("debounce", interval)
+
+	def _set_window(self, mode, interval):
+		self.flush()
+		self._window = None if interval is None else (mode, interval)
+
+	def flush(self):
+		"""Deliver a notification held back by throttle()/debounce() now"""
+		with self._rate_lock:
+			pending, self._pending = self._pending, None
+			if self._timer is not None:
+				self._timer.cancel()
+				self._timer = None
+			if pending is not None:
+				self._last_sent = time.monotonic()
+		if pending is not None:
+			with self._delivery_lock:
+				self._deliver(*pending)
+
+	def _schedule(self, delay):
+		"""Call _window_closed() after `delay` seconds: on the running event loop if there is one, else on a timer thread"""
+		self._timer_id += 1
+		try:
+			loop = asyncio.get_running_loop()
+		except RuntimeError:
+			self._start_thread_timer(delay, self._timer_id)
+		else:
+			self._timer = loop.create_task(self._window_task(delay, self._timer_id))
+
+	def _start_thread_timer(self, delay, timer_id):
+		self._timer = threading.Timer(delay, self._window_closed, (timer_id,))
+		self._timer.daemon = True
+		self._timer.start()
+
+	async def _window_task(self, delay, timer_id):
+		deadline = time.monotonic() + delay
+		try:
+			await asyncio.sleep(delay)
+		except asyncio.CancelledError:
+			# Cancelled by flush(), or by the loop shutting down (asyncio.run() cancels what is left).
+			# In the second case the window still has to close: a timer thread takes over.
+			with self._rate_lock:
+				if timer_id == self._timer_id and self._timer is not None:
+					self._start_thread_timer(max(deadline - time.monotonic(), 0), timer_id)
+			raise
+		self._window_closed(timer_id)
+
+	def _timer_dead(self):
+		"""True if the timer is a task on an event loop that has been closed: it will never fire"""
+		return isinstance(self._timer, asyncio.Task) and self._timer.get_loop().is_closed()
+
+	def _window_closed(self, timer_id):
+		with self._rate_lock:
+			if timer_id != self._timer_id or self._timer is None:
+				return # Cancelled by flush() while waiting for the lock, or a newer timer owns the window
+			now = time.monotonic()
+			if self._window is not None and self._window[0] == "debounce" and now < self._deadline:
+				self._schedule(self._deadline - now) # Changed again meanwhile: keep waiting
+				return
+			self._timer = None
+			pending, self._pending = self._pending, None
+			if pending is not None:
+				self._last_sent = now
+		if pending is not None:
+			with self._delivery_lock:
+				self._deliver(*pending)
+
+	def _window_allows(self, modifier):
+		"""Returns True if notify() may deliver now, otherwise holds the notification back"""
+		mode, interval = self._window
+		with self._rate_lock:
+			now = time.monotonic()
+			if self._timer is not None and self._timer_dead():
+				self._timer = None # Its loop was closed without cancelling it: schedule a new one
+			if mode == "throttle" and self._timer is None and now - self._last_sent >= interval:
+				self._last_sent = now
+				return True
+			self._pending = (modifier,) # Latest value wins: only the last held back notification is kept
+			if mode == "debounce":
+				self._deadline = now + interval
+				if self._timer is None:
+					self._schedule(interval)
+			elif self._timer is None:
+				self._schedule(self._last_sent + interval - now)
+			return False
 
 	def notify(self, modifier=None):
-		for observer in self._observers: # For all the observers in the list
+		if self._batch_depth:
+			self._batched = (modifier,)
+			return
+		if self._window is not None:
+			if self._window_allows(modifier):
+				with self._delivery_lock:
+					self._deliver(modifier)
+			return
+		self._deliver(modifier)
+
+	def _use_value_of(self, value_of):
+		"""Remember value_of(subject), the one value that conditions and the ring buffer are about"""
+		if value_of is None:
+			if self._value_of is None:
+				raise TypeError("{} needs value_of, e.g. value_of=operator.attrgetter(\"temp\")".format(type(self).__name__))
+		elif value_of is not self._value_of:
+			if self._conditions:
+				raise ValueError("the subscribed conditions are already checked against another value_of")
+			self._value_of = value_of
+
+	def subscribe(self, observer, condition, value_of=None):
+		"""Notify observer only when condition (Above, Below, Between, Crosses) holds for the new
+		value_of(subject). value_of can be left out once given. Returns a token for unsubscribe()."""
+		self._use_value_of(value_of)
+		if self._conditions is None:
+			self._conditions = ConditionIndex()
+		if not self._conditions: # Nothing was checked since the last rule went away: start from the current value
+			self._indexed_last = self._value_of(self)
+		return self._conditions.add(condition, observer)
+
+	def unsubscribe(self, token):
+		if self._conditions is not None:
+			self._conditions.remove(token)
+
+	def _recipients(self):
+		"""The attached observers, followed by the subscribers whose condition matches the current value"""
+		observers = self.observers()
+		if not self._conditions:
+			return observers
+		value, old = self._value_of(self), self._indexed_last
+		self._indexed_last = value
+		seen = set(map(id, observers))
+		for observer in self._conditions.matching(old, value):
+			if id(observer) not in seen: # Once per notification, however many of its conditions match
+				seen.add(id(observer))
+				observers.append(observer)
+		return observers
+
+	def publish_to(self, ring, value_of=None):
+		"""Also write value_of(subject) to a shared-memory RingBuffer on every notification (None stops it)"""
+		if ring is not None:
+			self._use_value_of(value_of)
+		self._ring = ring
+
+	def instrument(self, sample=1):
+		"""Measure every sample-th notification: update() latency per observer, fan-out and rate.
+		Returns the NotifyStats; instrument(None) switches it off again."""
+		self._stats = NotifyStats(sample) if sample else None
+		return self._stats
+
+	@property
+	def stats(self):
+		return self._stats
+
+	def _deliver(self, modifier=None):
+		if self._ring is not None:
+			self._ring.publish(self._value_of(self))
+		if self._fanout is not None:
+			self._fanout.publish(modifier) # Only queues the update, whatever the observers do
+			return
+		observers = self._recipients()
+		if self._stats is not None and self._stats.notified(len(observers)):
+			self._timed_updates(observers, modifier)
+			return
+		for observer in observers: # For all the observers (a copy, so they can detach while being notified)
 			if modifier != observer: # Don't notify the observer who is actually updating the temperature 
 				observer.update(self) # Alert the observers!
 
+	def _timed_updates(self, observers, modifier):
+		record, clock = self._stats.record, time.perf_counter_ns
+		for observer in observers:
+			if modifier != observer:
+				start = clock()
+				observer.update(self)
+				record(observer, clock() - start)
+
 class Core(Subject): #Inherits from the Subject class
 
-	def __init__(self, name=""):
-		Subject.__init__(self)
+	def __init__(self, name="", weak=False):
+		Subject.__init__(self, weak)
 		self._name = name #Set the name of the core
 		self._temp = 0 #Initialize the temperature of the core
 
@@ -60,6 +333,11 @@ class Core(Subject): #Inherits from the Subject class
 		self._temp = temp
 		self.notify() #Notify the observers whenever somebody changes the core temperature
 
+	async def set_temp(self, temp):
+		"""Set the temperature from async code, waiting for room in the observers' queues if needed"""
+		self._temp = temp
+		await self.notify_async()
+
 class TempViewer:
 
 	def update(self, subject): #Alert method that is invoked when the notify() method in a concrete subject is invoked
@@ -81,3 +359,860 @@ c1.attach(v2)
 c1.temp = 80
 c1.temp = 90
 
+#With weak references, a viewer that is thrown away stops being notified by itself
+c3 = Core("Core 3", weak=True)
+v3 = TempViewer()
+c3.attach(v3)
+c3.attach(TempViewer()) #Nobody else keeps this one
+c3.temp = 70 #Only v3 is left to be notified
+print("Core 3 has {} observer(s)".format(c3.observer_count))
+
+
+
+"""Asynchronous fan-out:
+    A slow observer makes every notify(), and so every temperature write, slow. After
+    enable_async() the subject only puts a snapshot of itself in one bounded queue per
+    observer, and an asyncio task per observer calls update() with it (awaiting it, if
+    update() is a coroutine). When a queue is full, the policy decides what happens:
+        "drop-oldest": the oldest queued update is dropped to make room
+        "coalesce":    everything still queued is replaced by the latest update
+        "block":       notify_async() (and Core.set_temp()) wait for room; a plain notify()
+                       can't wait, so it hands the update to a single task that does (later
+                       notify() calls meanwhile only replace the update that task will queue)
+    enable_async() has to be called with an event loop running, from async code."""
+
+OVERFLOW_POLICIES = ("drop-oldest", "coalesce", "block")
+
+
+class ObserverQueue(object):
+	"""Bounded queue and consumer task for one observer"""
+
+	def __init__(self, observer, maxsize, policy, weak=False):
+		self._observer = weakref.ref(observer) if weak else (lambda: observer)
+		self.maxsize = maxsize
+		self.policy = policy
+		self._items = collections.deque()
+		self._ready = asyncio.Event() # Set when there is something to deliver
+		self._space = asyncio.Event() # Set when an update has been taken off the queue
+		self._idle = asyncio.Event() # Set when everything queued has been delivered
+		self._idle.set()
+		self.delivered = 0
+		self.dropped = 0
+		self.coalesced = 0
+		self.waiting = 0 # Updates waiting for room (policy "block")
+		self.errors = 0
+		self.last_error = None
+		self._waiters = set()
+		self._blocked = None # (item,) that the task waiting for room on behalf of offer() will queue
+		self._blocked_put = None
+		self._task = asyncio.ensure_future(self._consume())
+
+	@property
+	def depth(self):
+		return len(self._items)
+
+	def _append(self, item):
+		self._items.append(item)
+		self._idle.clear()
+		self._ready.set()
+
+	def offer(self, item):
+		"""Queue an update without waiting, applying the overflow policy"""
+		if len(self._items) < self.maxsize and not self.waiting:
+			self._append(item)
+		elif self.policy == "drop-oldest":
+			self._items.popleft()
+			self.dropped += 1
+			self._append(item)
+		elif self.policy == "coalesce":
+			self.coalesced += len(self._items)
+			self._items.clear()
+			self._append(item)
+		else: # "block": one task waits for room, with the latest update offered meanwhile
+			if self._blocked is not None:
+				self.coalesced += 1
+			self._blocked = (item,)
+			if self._blocked_put is None:
+				self._blocked_put = asyncio.ensure_future(self._put_blocked())
+				self._waiters.add(self._blocked_put)
+				self._blocked_put.add_done_callback(self._waiters.discard)
+
+	async def _room(self):
+		self.waiting += 1
+		try:
+			while len(self._items) >= self.maxsize:
+				self._space.clear()
+				await self._space.wait()
+		finally:
+			self.waiting -= 1
+
+	async def _put_blocked(self):
+		try:
+			await self._room()
+			(item,), self._blocked = self._blocked, None
+			self._append(item)
+		finally:
+			self._blocked, self._blocked_put = None, None
+
+	async def put(self, item):
+		"""Queue an update, waiting for room if the policy is "block" """
+		if self.policy != "block":
+			self.offer(item)
+			return
+		await self._room()
+		self._append(item)
+
+	async def _consume(self):
+		while True:
+			while not self._items:
+				self._idle.set()
+				self._ready.clear()
+				await self._ready.wait()
+			item = self._items.popleft()
+			self._space.set()
+			observer = self._observer()
+			if observer is None: # A weakly held observer has been collected
+				self._items.clear()
+				self._idle.set()
+				return
+			stats = getattr(item, "_stats", None) # The snapshot carries the subject's NotifyStats
+			timed = stats is not None and stats.sample_delivery()
+			start = time.perf_counter_ns() if timed else 0
+			try:
+				result = observer.update(item)
+				if inspect.isawaitable(result):
+					await result
+			except Exception as e: # One failing observer shouldn't stop its own queue
+				self.errors += 1
+				self.last_error = e.with_traceback(None) # Its frames would keep the observer alive
+			if timed:
+				stats.record(observer, time.perf_counter_ns() - start)
+			self.delivered += 1
+			observer = item = result = None # Don't keep a weakly held observer alive while waiting for the next update
+
+	async def drain(self):
+		"""Wait until everything queued (or waiting for room) has been delivered"""
+		while self._waiters or self._items or not self._idle.is_set():
+			if self._task.done():
+				return
+			if self._waiters:
+				await asyncio.wait(list(self._waiters))
+			await self._idle.wait()
+			await asyncio.sleep(0) # Let the consumer pick up anything queued meanwhile
+
+	def close(self):
+		self._task.cancel()
+		for waiter in self._waiters:
+			waiter.cancel()
+
+
+class AsyncFanout(object):
+	"""The per-observer queues of one Subject, created when an observer is first notified"""
+
+	def __init__(self, subject, maxsize=100, policy="drop-oldest"):
+		if policy not in OVERFLOW_POLICIES:
+			raise ValueError("policy must be one of {}, not {!r}".format(OVERFLOW_POLICIES, policy))
+		self._subject = subject
+		self.maxsize = maxsize
+		self.policy = policy
+		self._queues = {} # id(observer) -> ObserverQueue
+
+	def _queue(self, observer):
+		queue = self._queues.get(id(observer))
+		if queue is None:
+			queue = self._queues[id(observer)] = ObserverQueue(observer, self.maxsize, self.policy, self._subject._weak)
+		return queue
+
+	def _targets(self, modifier):
+		snapshot = copy.copy(self._subject) # Observers see the state as it was when notify() was called
+		for observer in self._subject._recipients():
+			if modifier != observer:
+				yield self._queue(observer), snapshot
+
+	def publish(self, modifier=None):
+		targets = list(self._targets(modifier))
+		if self._subject._stats is not None:
+			self._subject._stats.notified(len(targets)) # Latencies are measured by the queues
+		for queue, snapshot in targets:
+			queue.offer(snapshot)
+
+	async def publish_wait(self, modifier=None):
+		for queue, snapshot in list(self._targets(modifier)):
+			await queue.put(snapshot)
+
+	def discard(self, observer):
+		self.forget(id(observer))
+
+	def forget(self, key):
+		"""Close the queue of the observer with this id()"""
+		queue = self._queues.pop(key, None)
+		if queue is not None:
+			queue.close()
+
+	async def drain(self):
+		for queue in list(self._queues.values()):
+			await queue.drain()
+
+	def close(self):
+		"""Cancel every queue; the subject goes back to notifying its observers directly"""
+		for queue in self._queues.values():
+			queue.close()
+		self._queues.clear()
+		if self._subject._fanout is self:
+			self._subject._fanout = None
+
+	def stats(self):
+		"""Queue depth and counters for every observer that has been notified so far"""
+		stats = {}
+		for queue in self._queues.values():
+			observer = queue._observer()
+			if observer is not None:
+				stats[observer] = {"depth": queue.depth, "delivered": queue.delivered, "dropped": queue.dropped,
+				                   "coalesced": queue.coalesced, "waiting": queue.waiting, "errors": queue.errors}
+		return stats
+
+
+class SlowTempViewer(TempViewer):
+	"""A viewer that needs a while for every update"""
+	async def update(self, subject):
+		await asyncio.sleep(0.01)
+		TempViewer.update(self, subject)
+
+
+async def async_fanout_demo():
+	c4 = Core("Core 4")
+	fanout = c4.enable_async(maxsize=2, policy="coalesce")
+	slow, quick = SlowTempViewer(), TempViewer()
+	c4.attach(slow)
+	c4.attach(quick)
+
+	start = time.perf_counter()
+	for temp in range(100, 105):
+		c4.temp = temp # Returns right away, the viewers catch up later
+	print("5 writes took {:.0f} us".format((time.perf_counter() - start) * 1e6))
+
+	await fanout.drain()
+	for observer, stats in fanout.stats().items():
+		print("{}: {}".format(type(observer).__name__, stats))
+	fanout.close()
+
+asyncio.run(async_fanout_demo())
+
+
+"""Coalescing notifications:
+    Sensors can write Core.temp thousands of times per second, while the viewers
+    only need the latest value. Writes inside `with core.batch():` are announced
+    once, when the block ends. core.throttle(seconds) lets at most one notification
+    through per window and core.debounce(seconds) waits until the writes have
+    stopped for that long. Either way the viewers are told about the latest state.
+    Threads: a notification held back by the window is delivered from the event loop
+    if the write happened inside one, otherwise from a timer thread (which also takes
+    over if that loop shuts down before the window closes). Deliveries of a
+    throttled or debounced subject are serialized, so update() may then run on another
+    thread, but never on two threads at once for the same subject."""
+
+class CountingViewer(object):
+	"""Counts its updates and remembers the last temperature it saw"""
+	def __init__(self):
+		self.updates = 0
+		self.last = None
+
+	def update(self, subject):
+		self.updates += 1
+		self.last = subject.temp
+
+c5 = Core("Core 5")
+counter = CountingViewer()
+c5.attach(counter)
+
+with c5.batch():
+	for temp in range(1000):
+		c5.temp = temp
+print("1000 writes in a batch: {} update(s), last temperature {}".format(counter.updates, counter.last))
+
+c5.throttle(0.05)
+for temp in range(1000):
+	c5.temp = temp
+c5.flush() # Or wait for the window to close
+print("1000 throttled writes: {} update(s) in total, last temperature {}".format(counter.updates, counter.last))
+c5.throttle(None)
+
+
+"""Conditional subscriptions:
+    Alert rules usually only care about some temperatures. Instead of notifying every
+    rule and letting it check for itself, subscribe(observer, condition, value_of) hands
+    the condition and what it is about (the temperature here) to the subject, which keeps all conditions in sorted lists and an
+    interval tree. A new temperature then finds the matching rules with a binary
+    search (O(log n + k) for k matches) and only those are notified. The index is
+    rebuilt on the first notification after rules have been added or removed."""
+
+class Above(collections.namedtuple("Above", "threshold")):
+	"""Matches while the value is greater than threshold"""
+	__slots__ = ()
+
+	def matches(self, old, new):
+		return new > self.threshold
+
+class Below(collections.namedtuple("Below", "threshold")):
+	"""Matches while the value is less than threshold"""
+	__slots__ = ()
+
+	def matches(self, old, new):
+		return new < self.threshold
+
+class Between(collections.namedtuple("Between", "low high")):
+	"""Matches while low <= value <= high"""
+	__slots__ = ()
+
+	def matches(self, old, new):
+		return self.low <= new <= self.high
+
+class Crosses(collections.namedtuple("Crosses", "threshold")):
+	"""Matches when the value moves from one side of threshold (<=, >) to the other"""
+	__slots__ = ()
+
+	def matches(self, old, new):
+		return old is not None and (old > self.threshold) != (new > self.threshold)
+
+
+class _IntervalNode(object):
+	"""Centered interval tree over (low, high, token) intervals"""
+	__slots__ = ("center", "by_low", "by_high", "left", "right")
+
+	def __init__(self, intervals):
+		endpoints = sorted(itertools.chain.from_iterable((low, high) for low, high, _ in intervals))
+		self.center = endpoints[len(endpoints) // 2]
+		here, left, right = [], [], []
+		for interval in intervals:
+			if interval[1] < self.center:
+				left.append(interval)
+			elif interval[0] > self.center:
+				right.append(interval)
+			else:
+				here.append(interval)
+		self.by_low = sorted(here, key=lambda interval: interval[0]) # For values left of the center
+		self.by_high = sorted(here, key=lambda interval: interval[1], reverse=True) # For values right of it
+		self.left = _IntervalNode(left) if left else None
+		self.right = _IntervalNode(right) if right else None
+
+	def stab(self, value, found):
+		"""Append the token of every interval that contains value"""
+		node = self
+		while node is not None:
+			if value < node.center:
+				for low, _, token in node.by_low:
+					if low > value:
+						break
+					found.append(token)
+				node = node.left
+			elif value > node.center:
+				for _, high, token in node.by_high:
+					if high < value:
+						break
+					found.append(token)
+				node = node.right
+			else:
+				found.extend(token for _, _, token in node.by_low)
+				return
+
+
+class ConditionIndex(object):
+	"""All the conditions subscribed to one subject, indexed by their thresholds"""
+
+	def __init__(self):
+		self._subscriptions = {} # token -> (condition, observer)
+		self._tokens = itertools.count()
+		self._dirty = True
+
+	def __len__(self):
+		return len(self._subscriptions)
+
+	def add(self, condition, observer):
+		if not isinstance(condition, (Above, Below, Between, Crosses)):
+			raise TypeError("Unsupported condition: {!r}".format(condition))
+		token = next(self._tokens)
+		self._subscriptions[token] = (condition, observer)
+		self._dirty = True
+		return token
+
+	def remove(self, token):
+		if self._subscriptions.pop(token, None) is not None:
+			self._dirty = True
+
+	def _rebuild(self):
+		by_kind = collections.defaultdict(list)
+		for token, (condition, _) in self._subscriptions.items():
+			by_kind[type(condition)].append((condition, token))
+		for kind in (Above, Below, Crosses):
+			pairs = sorted((condition.threshold, token) for condition, token in by_kind[kind])
+			setattr(self, "_" + kind.__name__.lower(), ([t for t, _ in pairs], [token for _, token in pairs]))
+		between = [(condition.low, condition.high, token) for condition, token in by_kind[Between]]
+		self._between = _IntervalNode(between) if between else None
+		self._dirty = False
+
+	def matching(self, old, new):
+		"""The observers whose condition holds when the value changes from old to new"""
+		if self._dirty:
+			self._rebuild()
+		thresholds, tokens = self._above # threshold < new
+		found = tokens[:bisect.bisect_left(thresholds, new)]
+		thresholds, tokens = self._below # threshold > new
+		found.extend(tokens[bisect.bisect_right(thresholds, new):])
+		if old is not None and old != new: # min <= threshold < max
+			thresholds, tokens = self._crosses
+			found.extend(tokens[bisect.bisect_left(thresholds, min(old, new)):bisect.bisect_left(thresholds, max(old, new))])
+		if self._between is not None:
+			self._between.stab(new, found)
+		subscriptions = self._subscriptions
+		return [subscriptions[token][1] for token in found]
+
+
+class AlertViewer(object):
+	def __init__(self, message):
+		self.message = message
+
+	def update(self, subject):
+		print("{}: {} at {}".format(self.message, subject._name, subject.temp))
+
+temperature = operator.attrgetter("temp") #What the conditions are about
+
+c6 = Core("Core 6")
+c6.subscribe(AlertViewer("Overheating"), Above(95), temperature)
+c6.subscribe(AlertViewer("Too cold"), Below(10), temperature)
+c6.subscribe(AlertViewer("Comfortable"), Between(40, 60), temperature)
+c6.subscribe(AlertViewer("Crossed 80"), Crosses(80), temperature)
+for temp in (50, 85, 99, 70, 5):
+	c6.temp = temp
+
+
+"""Cross-process observers:
+    A Core in one process can publish every change into a ring buffer in shared
+    memory with publish_to(). Observers in other processes read it through a
+    MirrorCore, a local Core that follows the published values, without pickling
+    and without sockets. There is a single writer, so no lock is needed: every
+    record carries its sequence number before and after the payload, and the
+    writer moves the head forward only when the record is complete. A reader
+    that falls more than a full ring behind loses the oldest records; it counts
+    them and reports how far behind the writer it is."""
+
+_created_rings = set() # Names of the RingBuffers created by this process
+
+def _attach_shared_memory(name):
+	"""Open existing shared memory without letting this process's resource tracker delete it at exit"""
+	try:
+		return shared_memory.SharedMemory(name, track=False) # Python 3.13+
+	except TypeError:
+		memory = shared_memory.SharedMemory(name)
+		#Processes started by multiprocessing share their parent's tracker, which must keep the name;
+		#any other process has its own tracker, which would unlink the memory when it exits
+		if name not in _created_rings and multiprocessing.parent_process() is None:
+			resource_tracker.unregister(memory._name, "shared_memory")
+		return memory
+
+
+class RingBuffer(object):
+	"""Ring of (value, timestamp) records in shared memory, for one writer and any number of readers"""
+	_HEADER = struct.Struct("QQ") # capacity, sequence number of the last complete record
+	_SLOT = struct.Struct("QddQ") # sequence number, value, time.perf_counter() when published, sequence number again
+
+	def __init__(self, capacity=4096, name=None):
+		self.capacity = capacity
+		self._memory = shared_memory.SharedMemory(name, create=True, size=self._HEADER.size + capacity * self._SLOT.size)
+		self._buffer = self._memory.buf
+		self._HEADER.pack_into(self._buffer, 0, capacity, 0)
+		self._sequence = 0
+		_created_rings.add(self._memory.name)
+
+	@property
+	def name(self):
+		"""Pass this to RingReader/MirrorCore in the other processes"""
+		return self._memory.name
+
+	def publish(self, value):
+		sequence = self._sequence + 1
+		offset = self._HEADER.size + (sequence % self.capacity) * self._SLOT.size
+		struct.pack_into("Q", self._buffer, offset, sequence) # A reader that sees this number change knows it was overwritten
+		struct.pack_into("ddQ", self._buffer, offset + 8, value, time.perf_counter(), sequence)
+		struct.pack_into("Q", self._buffer, 8, sequence) # Only now does the record become visible
+		self._sequence = sequence
+
+	def close(self):
+		self._buffer.release()
+		self._memory.close()
+		self._memory.unlink()
+		_created_rings.discard(self._memory.name)
+
+
+class RingReader(object):
+	"""One reader's position in a RingBuffer, possibly in another process"""
+
+	def __init__(self, name):
+		self._memory = _attach_shared_memory(name)
+		self._buffer = self._memory.buf
+		self.capacity, head = RingBuffer._HEADER.unpack_from(self._buffer, 0)
+		self._next = head + 1 # Start with the next change
+		self.received = 0
+		self.lost = 0 # Records overwritten before this reader got to them
+
+	@property
+	def lag(self):
+		"""How many published records this reader hasn't read yet"""
+		return struct.unpack_from("Q", self._buffer, 8)[0] - self._next + 1
+
+	def poll(self, limit=None):
+		"""Return the new (value, timestamp) records, oldest first"""
+		records = []
+		buffer, slot, capacity = self._buffer, RingBuffer._SLOT, self.capacity
+		head = struct.unpack_from("Q", buffer, 8)[0]
+		while self._next <= head and (limit is None or len(records) < limit):
+			oldest = head - capacity + 1
+			if self._next < oldest: # Fell a whole ring behind: skip what has been overwritten
+				self.lost += oldest - self._next
+				self._next = oldest
+			offset = RingBuffer._HEADER.size + (self._next % capacity) * slot.size
+			first, value, timestamp, last = slot.unpack_from(buffer, offset)
+			if first != self._next or last != self._next or struct.unpack_from("Q", buffer, offset)[0] != self._next:
+				head = struct.unpack_from("Q", buffer, 8)[0] # Overwritten while we read it: catch up and retry
+				continue
+			records.append((value, timestamp))
+			self._next += 1
+		self.received += len(records)
+		return records
+
+	def close(self):
+		self._buffer.release()
+		self._memory.close()
+
+
+class MirrorCore(Core):
+	"""A Core that follows a Core in another process through a RingBuffer: attach local observers to it"""
+
+	def __init__(self, name, ring_name):
+		Core.__init__(self, name)
+		self.reader = RingReader(ring_name)
+
+	def pump(self, limit=None):
+		"""Apply the changes published since the last call (notifying the local observers), returns how many"""
+		records = self.reader.poll(limit)
+		for value, _ in records:
+			self.temp = value
+		return len(records)
+
+	def close(self):
+		self.reader.close()
+
+ring = RingBuffer(capacity=4)
+c7 = Core("Core 7")
+c7.publish_to(ring, temperature)
+mirror = MirrorCore("Core 7 (mirror)", ring.name) # Normally in another process
+mirror.attach(TempViewer())
+for temp in range(60, 67):
+	c7.temp = temp
+print("Mirror is {} behind".format(mirror.reader.lag))
+mirror.pump() # The ring only holds 4 records, so the oldest ones were lost
+print("Mirror lost {} change(s) and is {} behind".format(mirror.reader.lost, mirror.reader.lag))
+mirror.close()
+c7.publish_to(None)
+ring.close()
+
+
+"""Instrumentation:
+    core.instrument(sample=n) measures every n-th notification: how long each
+    observer's update() takes (kept as a histogram with power-of-two buckets), how many
+    observers each notification reaches and how many notifications per second the
+    subject sends. Switched off, it costs notify() one attribute check; with sampling,
+    the notifications that aren't sampled only cost a few counter increments.
+    dump() prints the slowest observers."""
+
+class NotifyStats(object):
+	"""Notification statistics of one Subject, see Subject.instrument()"""
+
+	def __init__(self, sample=1):
+		self.sample = sample
+		self.notifications = 0
+		self.sampled = 0
+		self.fanout_total = 0
+		self.fanout_max = 0
+		self.started = time.perf_counter()
+		self._deliveries = 0 # Asynchronous deliveries seen, for sampling them too
+		self._observers = {} # id(observer) -> [name, calls, total ns, max ns, histogram]
+
+	def notified(self, fanout):
+		"""Count a notification reaching `fanout` observers; returns True if it should be measured"""
+		self.notifications += 1
+		self.fanout_total += fanout
+		if fanout > self.fanout_max:
+			self.fanout_max = fanout
+		if self.notifications % self.sample:
+			return False
+		self.sampled += 1
+		return True
+
+	def sample_delivery(self):
+		self._deliveries += 1
+		return not self._deliveries % self.sample
+
+	def record(self, observer, nanoseconds):
+		entry = self._observers.get(id(observer))
+		if entry is None:
+			name = "{} at {:#x}".format(type(observer).__name__, id(observer))
+			entry = self._observers[id(observer)] = [name, 0, 0, 0, [0] * 64]
+		entry[1] += 1
+		entry[2] += nanoseconds
+		if nanoseconds > entry[3]:
+			entry[3] = nanoseconds
+		entry[4][min(nanoseconds.bit_length(), 63)] += 1 # Bucket b holds latencies below 2**b ns
+
+	@property
+	def rate(self):
+		"""Notifications per second since instrument() was called"""
+		elapsed = time.perf_counter() - self.started
+		return self.notifications / elapsed if elapsed else 0.0
+
+	@staticmethod
+	def _percentile(histogram, fraction):
+		"""Upper bound (ns) of the bucket holding the given fraction of the calls"""
+		wanted, seen = fraction * sum(histogram), 0
+		for bucket, count in enumerate(histogram):
+			seen += count
+			if count and seen >= wanted:
+				return 1 << bucket
+		return 0
+
+	def slowest(self, top=10):
+		"""The `top` observers with the highest mean update() latency"""
+		rows = []
+		for name, calls, total, longest, histogram in self._observers.values():
+			rows.append({"observer": name, "calls": calls, "mean_us": total / calls / 1e3,
+			             "p50_us": self._percentile(histogram, 0.5) / 1e3,
+			             "p99_us": self._percentile(histogram, 0.99) / 1e3, "max_us": longest / 1e3,
+			             "histogram": {1 << bucket: count for bucket, count in enumerate(histogram) if count}})
+		rows.sort(key=lambda row: row["mean_us"], reverse=True)
+		return rows[:top]
+
+	def dump(self, top=10, file=None):
+		"""Print a summary and the `top` slowest observers"""
+		file = file or sys.stdout
+		mean_fanout = self.fanout_total / self.notifications if self.notifications else 0.0
+		print("{} notifications ({} measured), {:.1f}/s, fan-out mean {:.1f} max {}".format(
+			self.notifications, self.sampled, self.rate, mean_fanout, self.fanout_max), file=file)
+		for row in self.slowest(top):
+			print("  {:32} {:6} calls | mean {:9.1f} us | p50 < {:9.1f} us | p99 < {:9.1f} us | max {:9.1f} us".format(
+				row["observer"], row["calls"], row["mean_us"], row["p50_us"], row["p99_us"], row["max_us"]), file=file)
+
+
+class SleepyViewer(CountingViewer):
+	"""An observer that takes about a millisecond per update"""
+	def update(self, subject):
+		time.sleep(0.001)
+		CountingViewer.update(self, subject)
+
+c8 = Core("Core 8")
+for viewer in (CountingViewer(), SleepyViewer(), CountingViewer()):
+	c8.attach(viewer)
+c8.instrument(sample=2) # Measure every other notification
+for temp in range(20):
+	c8.temp = temp
+c8.stats.dump(top=2)
+c8.instrument(None)
+
+
+def benchmark_subject(count=100000):
+	"""attach/notify/detach with `count` observers: the old list-based Subject vs the dict-based one"""
+	class ListSubject(object): #The original implementation, for comparison
+		def __init__(self):
+			self._observers = []
+
+		def attach(self, observer):
+			if observer not in self._observers:
+				self._observers.append(observer)
+
+		def detach(self, observer):
+			try:
+				self._observers.remove(observer)
+			except ValueError:
+				pass
+
+		def notify(self, modifier=None):
+			for observer in self._observers:
+				if modifier != observer:
+					observer.update(self)
+
+	class QuietViewer:
+		def update(self, subject):
+			pass
+
+	#The list version is quadratic, so it only gets a tenth of the observers
+	for label, make, n in (("list Subject (old)", ListSubject, count // 10), ("Subject", Subject, count),
+	                       ("Subject(weak=True)", lambda: Subject(weak=True), count)):
+		subject = make()
+		viewers = [QuietViewer() for _ in range(n)]
+		attach = timeit.timeit(lambda: [subject.attach(viewer) for viewer in viewers], number=1)
+		notify = timeit.timeit(subject.notify, number=1)
+		detach = timeit.timeit(lambda: [subject.detach(viewer) for viewer in reversed(viewers)], number=1)
+		print("{:18}: attach {:7.3f}s | notify {:6.3f}s | detach {:7.3f}s for {} observers".format(label, attach, notify, detach, n))
+
+def benchmark_coalescing(writes=100000, observers=20, interval=0.01):
+	"""Observer calls and CPU time for `writes` temperature writes, with and without coalescing"""
+	def run(label, setup, write_all):
+		core = Core("Bench")
+		viewers = [CountingViewer() for _ in range(observers)]
+		for viewer in viewers:
+			core.attach(viewer)
+		setup(core)
+		cpu, wall = time.process_time(), time.perf_counter()
+		write_all(core)
+		core.flush()
+		cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+		calls = sum(viewer.updates for viewer in viewers)
+		assert all(viewer.last == writes - 1 for viewer in viewers) # Nobody missed the latest value
+		print("{:22}: {:8} observer calls | {:.3f}s CPU | {:.3f}s wall".format(label, calls, cpu, wall))
+
+	def plain_writes(core):
+		for temp in range(writes):
+			core.temp = temp
+
+	def batched_writes(core, size=1000):
+		for start in range(0, writes, size):
+			with core.batch():
+				for temp in range(start, min(start + size, writes)):
+					core.temp = temp
+
+	def paced_writes(core, bursts=500):
+		#Spread the writes over bursts about 1 ms apart, like a sensor would
+		size = max(writes // bursts, 1)
+		for start in range(0, writes, size):
+			for temp in range(start, min(start + size, writes)):
+				core.temp = temp
+			time.sleep(0.001)
+
+	run("every write", lambda core: None, plain_writes)
+	run("batches of 1000", lambda core: None, batched_writes)
+	run("every write (paced)", lambda core: None, paced_writes)
+	run("throttle {:.0f} ms (paced)".format(interval * 1e3), lambda core: core.throttle(interval), paced_writes)
+	run("debounce {:.0f} ms (paced)".format(interval * 1e3), lambda core: core.debounce(interval), paced_writes)
+
+def benchmark_conditions(rules=50000, writes=2000):
+	"""`rules` threshold alerts: every rule checking every write vs the ConditionIndex"""
+	class Alert(object):
+		def __init__(self, condition):
+			self.condition = condition
+			self.fired = 0
+
+		def update(self, subject):
+			self.fired += 1
+
+	class FilteringAlert(Alert): # What observers have to do without subscribe()
+		last = 0 # Core temperatures start at 0
+
+		def update(self, subject):
+			if self.condition.matches(self.last, subject.temp):
+				self.fired += 1
+			self.last = subject.temp
+
+	#Alerts on the extremes, narrow bands and crossings: each write only concerns a few of them
+	rng = random.Random(1)
+	conditions = []
+	for _ in range(rules):
+		low = rng.uniform(0, 100)
+		conditions.append(rng.choice([Above(rng.uniform(90, 100)), Below(rng.uniform(0, 10)),
+		                              Between(low, low + rng.uniform(0, 0.1)), Crosses(low)]))
+	temps = [rng.uniform(20, 80) for _ in range(writes)]
+
+	filtered, indexed = Core("Filtered"), Core("Indexed")
+	filtering_alerts = [FilteringAlert(condition) for condition in conditions]
+	for alert in filtering_alerts:
+		filtered.attach(alert)
+	indexed_alerts = [Alert(condition) for condition in conditions]
+	for alert in indexed_alerts:
+		indexed.subscribe(alert, alert.condition, temperature)
+
+	for label, core, alerts in (("every rule filters", filtered, filtering_alerts), ("ConditionIndex", indexed, indexed_alerts)):
+		start = time.perf_counter()
+		for temp in temps:
+			core.temp = temp
+		elapsed = time.perf_counter() - start
+		print("{:18}: {:.1f} us per write, {} alerts fired".format(label, elapsed / writes * 1e6, sum(alert.fired for alert in alerts)))
+
+def _ring_consumer(ring_name, count, results, ready):
+	reader = RingReader(ring_name)
+	ready.set() # Attached: from now on no change is missed
+	latencies = []
+	while reader.received + reader.lost < count:
+		records = reader.poll()
+		now = time.perf_counter()
+		latencies.extend(now - timestamp for _, timestamp in records)
+		if not records:
+			time.sleep(0) # Let the writer run
+	results.put((latencies, reader.lost))
+	reader.close()
+
+def _queue_consumer(queue, count, results):
+	latencies = []
+	for _ in range(count):
+		_, timestamp = queue.get()
+		latencies.append(time.perf_counter() - timestamp)
+	results.put((latencies, 0))
+
+def benchmark_shared_memory(count=200000, capacity=65536):
+	"""Cross-process fan-out of `count` changes: shared-memory RingBuffer vs multiprocessing.Queue"""
+	def report(label, elapsed, latencies, lost):
+		percentiles = statistics.quantiles(latencies, n=100)
+		print("{:22}: {:9.0f} msg/s | p50 {:8.1f} us | p99 {:8.1f} us | lost {}".format(
+			label, len(latencies) / elapsed, percentiles[49] * 1e6, percentiles[98] * 1e6, lost))
+
+	results = multiprocessing.Queue()
+
+	ring = RingBuffer(capacity=capacity)
+	core = Core("Bench")
+	core.publish_to(ring, temperature)
+	ready = multiprocessing.Event()
+	consumer = multiprocessing.Process(target=_ring_consumer, args=(ring.name, count, results, ready))
+	consumer.start()
+	if not ready.wait(10): # The reader only sees changes published after it attached
+		consumer.terminate()
+		ring.close()
+		raise RuntimeError("ring consumer did not attach")
+	start = time.perf_counter()
+	for temp in range(count):
+		core.temp = temp
+	latencies, lost = results.get()
+	elapsed = time.perf_counter() - start
+	consumer.join()
+	ring.close()
+	report("shared-memory ring", elapsed, latencies, lost)
+
+	queue = multiprocessing.Queue()
+	consumer = multiprocessing.Process(target=_queue_consumer, args=(queue, count, results))
+	consumer.start()
+	start = time.perf_counter()
+	for temp in range(count):
+		queue.put((temp, time.perf_counter()))
+	latencies, lost = results.get()
+	elapsed = time.perf_counter() - start
+	consumer.join()
+	report("multiprocessing.Queue", elapsed, latencies, lost)
+
+def benchmark_instrumentation(writes=100000, observers=10):
+	"""Cost of a temperature write with instrumentation off, sampling 1 in 100, and measuring every notification"""
+	core = Core("Bench")
+	for _ in range(observers):
+		core.attach(CountingViewer())
+
+	def writes_loop():
+		for temp in range(writes):
+			core.temp = temp
+
+	for label, sample in (("off", None), ("sample 1 in 100", 100), ("every notification", 1)):
+		core.instrument(sample)
+		best = min(timeit.repeat(writes_loop, number=1, repeat=3))
+		print("{:18}: {:.0f} ns per write ({} observers)".format(label, best / writes * 1e9, observers))
+	core.instrument(None)
+
+# Benchmark (run with: python Observer.py --bench)
+if __name__ == "__main__" and "--bench" in sys.argv:
+	benchmark_subject()
+	benchmark_coalescing()
+	benchmark_conditions()
+	benchmark_shared_memory()
+	benchmark_instrumentation()
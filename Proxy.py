@@ -21,7 +21,26 @@
     holds a reference to the RealSubject. It can add additional 
     functionalities or control access to the RealSubject methods."""
 
+import asyncio
+import contextlib
+import inspect
+import io
+import itertools
+import json
+import multiprocessing
+import mmap
+import os
+import socket
+import statistics
+import struct
+import sys
+import tempfile
+import threading
 import time
+import timeit
+import tracemalloc
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 class Producer:
 	"""Define the 'resource-intensive' object to instantiate!"""
@@ -31,22 +50,71 @@ class Producer:
 	def meet(self):
 		print("Producer has time to meet you now!")
 
+_MISSING = object() #Marks a LazyProxy whose subject hasn't been built yet
+
+class LazyProxy:
+	"""Virtual proxy: builds the real subject on first use, exactly once, then forwards to it"""
+	def __init__(self, factory, *args, **kwargs):
+		object.__setattr__(self, "_lazy_factory", lambda: factory(*args, **kwargs))
+		object.__setattr__(self, "_lazy_subject", _MISSING)
+		object.__setattr__(self, "_lazy_lock", threading.Lock())
+
+	def _lazy_get(self):
+		subject = self._lazy_subject
+		if subject is _MISSING: #First check without the lock: the fast path once built
+			with self._lazy_lock:
+				subject = self._lazy_subject
+				if subject is _MISSING: #Second check: another thread may have built it while we waited
+					subject = self._lazy_factory()
+					object.__setattr__(self, "_lazy_subject", subject)
+					object.__setattr__(self, "_lazy_factory", None) #Drop the factory and its arguments
+		return subject
+
+	def __getattr__(self, attr):
+		"""Only called for attributes the proxy itself doesn't have"""
+		if attr.startswith("_lazy_"): #Not set up by __init__ (e.g. a copy being built): don't build or recurse
+			raise AttributeError(attr)
+		value = getattr(self._lazy_get(), attr)
+
+		#Remember bound methods in the proxy's own __dict__: the next lookup is then a
+		#plain instance attribute hit and never reaches __getattr__ again.
+		#Data attributes aren't cached since the subject may change them.
+		if inspect.ismethod(value):
+			object.__setattr__(self, attr, value)
+		return value
+
+	def __setattr__(self, attr, value):
+		setattr(self._lazy_get(), attr, value)
+		self.__dict__.pop(attr, None) #Forget a cached method that has just been replaced
+
+	def __repr__(self):
+		subject = self._lazy_subject
+		if subject is _MISSING:
+			return "<LazyProxy (not built yet)>"
+		return "<LazyProxy for {!r}>".format(subject)
+
+def lazy_proxy(factory, *args, **kwargs):
+	"""Wrap any class (or other factory) so that factory(*args, **kwargs) only runs on first use
+
+	Only plain attributes and methods are forwarded: Python looks special methods up on
+	the type, so len(proxy), proxy[0] or proxy + 1 don't reach the subject."""
+	return LazyProxy(factory, *args, **kwargs)
+
 class Proxy:
 	""""Define the 'relatively less resource-intensive' proxy to instantiate as a middleman"""
 	def __init__(self):  
 		self.occupied = 'No'
-		self.producer = None
+		self.producer = lazy_proxy(Producer) #The producer object is only created the first time it is needed
 
 	def produce(self):
 		"""Check if Producer is available"""
 		print("Artist checking if Producer is available ...")
 
 		if self.occupied == 'No':
-			#If the producer is available, create a producer object!
-			self.producer = Producer()
+			#If the producer is available, wait for the meeting
 			time.sleep(2)
 
-			#Make the prodcuer meet the guest!
+			#Make the prodcuer meet the guest! (this is where the producer object gets created)
 			self.producer.meet()
 			
 		else:
@@ -66,6 +134,311 @@ p.occupied = 'Yes'
 #Make the Producer produce
 p.produce()
 
+class AsyncProxy:
+	"""Asyncio version of the Proxy: waits for the Producer without blocking the event loop"""
+	def __init__(self, delay=2):
+		self.delay = delay #How long a guest waits for the Producer / how long the Producer takes to get ready
+		self.producer = None
+		self._free = asyncio.Event() #Set while the Producer is available
+		self._free.set()
+		self._producer_task = None #Shared by every caller that arrives before the Producer exists
+
+	@property
+	def occupied(self):
+		return 'No' if self._free.is_set() else 'Yes'
+
+	@occupied.setter
+	def occupied(self, value):
+		if value == 'No':
+			self._free.set() #Wake up every guest waiting for the Producer
+		else:
+			self._free.clear()
+
+	async def _create_producer(self):
+		"""The expensive part: only ever runs once, however many guests arrive together"""
+		await asyncio.sleep(self.delay)
+		self.producer = Producer()
+		return self.producer
+
+	async def _get_producer(self):
+		if self.producer is not None:
+			return self.producer
+
+		#The first caller starts the creation, everybody else awaits the very same task
+		if self._producer_task is None:
+			self._producer_task = asyncio.ensure_future(self._create_producer())
+		try:
+			#shield() so a cancelled guest does not cancel the creation for the others
+			return await asyncio.shield(self._producer_task)
+		except Exception:
+			self._producer_task = None #Let the next guest try again
+			raise
+
+	async def produce(self):
+		"""Wait (without sleeping the thread) until the Producer is available"""
+		print("Artist checking if Producer is available ...")
+
+		try:
+			await asyncio.wait_for(self._free.wait(), self.delay)
+		except asyncio.TimeoutError:
+			print("Producer is busy!")
+			return False
+
+		producer = await self._get_producer()
+		producer.meet()
+		return True
+
+#Many threads hit a lazy proxy at once, but the expensive object is only built once
+class SlowToBuild:
+	built = 0
+
+	def __init__(self):
+		time.sleep(0.05)
+		SlowToBuild.built += 1
+
+	def ping(self):
+		return "pong"
+
+lazy = lazy_proxy(SlowToBuild)
+with ThreadPoolExecutor(max_workers=8) as pool:
+	list(pool.map(lambda _: lazy.ping(), range(32)))
+print("SlowToBuild was built {} time(s) for 32 calls".format(SlowToBuild.built)) #1
+
+async def main():
+	ap = AsyncProxy(delay=0.1)
+
+	#Many guests at once, but only one Producer is created
+	await asyncio.gather(*(ap.produce() for _ in range(3)))
+
+	ap.occupied = 'Yes'
+	await ap.produce()
+
+asyncio.run(main())
+
+#Remote proxy: the Producer lives in another process and is reached over a socket
+REMOTE_METHODS = ("produce", "meet") #Access control: the only methods a client may call
+
+class RemoteError(Exception):
+	"""Raised on the client when the remote Producer call failed"""
+
+def _send_frame(writer, payload):
+	"""Frames are a 4-byte length followed by a JSON list of calls (or replies)"""
+	data = json.dumps(payload).encode()
+	writer.write(struct.pack("!I", len(data)) + data)
+
+async def _read_frame(reader):
+	header = await reader.readexactly(4)
+	return json.loads(await reader.readexactly(struct.unpack("!I", header)[0]))
+
+async def _serve_producer(address, ready):
+	producer = Producer()
+
+	async def handle(reader, writer):
+		try:
+			while True:
+				replies = []
+				for call_id, method in await _read_frame(reader): #One frame may hold a whole batch of calls
+					if method not in REMOTE_METHODS:
+						replies.append([call_id, None, "method not allowed: {}".format(method)])
+						continue
+					try:
+						replies.append([call_id, getattr(producer, method)(), None])
+					except Exception as e:
+						replies.append([call_id, None, repr(e)])
+				_send_frame(writer, replies)
+				await writer.drain()
+		except (asyncio.IncompleteReadError, ConnectionError):
+			pass #The client went away
+		finally:
+			writer.close()
+
+	if isinstance(address, str):
+		server = await asyncio.start_unix_server(handle, path=address)
+	else:
+		server = await asyncio.start_server(handle, *address)
+		address = server.sockets[0].getsockname()[:2] #The port the OS picked
+	ready.send(address)
+	ready.close()
+	async with server:
+		await server.serve_forever()
+
+def _run_producer_server(address, ready, quiet):
+	if quiet:
+		sys.stdout = open(os.devnull, "w")
+	else:
+		sys.stdout.reconfigure(line_buffering=True) #Don't lose output when the process is terminated
+	asyncio.run(_serve_producer(address, ready))
+
+class ProducerServer:
+	"""Runs a Producer in its own process, on a Unix socket (or TCP loopback where there are none)"""
+	def __init__(self, quiet=False, timeout=10):
+		self._tmpdir = None
+		if hasattr(socket, "AF_UNIX"):
+			self._tmpdir = tempfile.TemporaryDirectory()
+			address = os.path.join(self._tmpdir.name, "producer.sock")
+		else:
+			address = ("127.0.0.1", 0)
+
+		ready, child_ready = multiprocessing.Pipe(duplex=False)
+		self._process = multiprocessing.Process(target=_run_producer_server, args=(address, child_ready, quiet), daemon=True)
+		self._process.start()
+		child_ready.close()
+		if not ready.poll(timeout):
+			self.stop()
+			raise RuntimeError("Producer server did not start")
+		self.address = ready.recv()
+
+	def stop(self):
+		self._process.terminate()
+		self._process.join()
+		if self._tmpdir is not None:
+			self._tmpdir.cleanup()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.stop()
+
+class _Connection:
+	"""One pooled connection: calls are pipelined and sent in batches"""
+	def __init__(self, reader, writer, max_batch):
+		self._reader = reader
+		self._writer = writer
+		self._max_batch = max_batch
+		self._ids = itertools.count()
+		self._queue = asyncio.Queue() #Calls waiting to be sent
+		self._pending = {} #call id -> future, for calls sent but not answered yet
+		self.closed = None #Why the connection is unusable, once it is
+		self.calls_sent = 0
+		self.batches_sent = 0
+		self._tasks = [asyncio.ensure_future(self._send_loop()), asyncio.ensure_future(self._receive_loop())]
+
+	@property
+	def in_flight(self):
+		return len(self._pending)
+
+	async def call(self, method):
+		if self.closed is not None:
+			raise RemoteError(self.closed)
+		call_id = next(self._ids)
+		future = asyncio.get_running_loop().create_future()
+		self._pending[call_id] = future
+		self._queue.put_nowait([call_id, method])
+		return await future
+
+	def _fail(self, error):
+		"""Fail every waiting call and stop both loops: the server is gone"""
+		self.closed = "connection lost: {!r}".format(error)
+		for future in self._pending.values():
+			if not future.done():
+				future.set_exception(RemoteError(self.closed))
+		self._pending.clear()
+		for task in self._tasks:
+			if task is not asyncio.current_task():
+				task.cancel()
+		self._writer.close()
+
+	async def _send_loop(self):
+		try:
+			while True:
+				batch = [await self._queue.get()]
+				#Everything queued meanwhile goes out in the same frame
+				while len(batch) < self._max_batch and not self._queue.empty():
+					batch.append(self._queue.get_nowait())
+				_send_frame(self._writer, batch)
+				self.calls_sent += len(batch)
+				self.batches_sent += 1
+				await self._writer.drain() #No waiting for replies here: requests are pipelined
+		except (ConnectionError, OSError) as e:
+			self._fail(e)
+
+	async def _receive_loop(self):
+		try:
+			while True:
+				for call_id, result, error in await _read_frame(self._reader):
+					future = self._pending.pop(call_id)
+					if future.done():
+						continue #The caller was cancelled
+					if error is None:
+						future.set_result(result)
+					else:
+						future.set_exception(RemoteError(error))
+		except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+			self._fail(e)
+
+	async def close(self):
+		for task in self._tasks:
+			task.cancel()
+		await asyncio.gather(*self._tasks, return_exceptions=True)
+		self._writer.close()
+
+class RemoteProducerProxy:
+	"""Remote proxy: looks like a Producer, but produce()/meet() run in the ProducerServer process"""
+	def __init__(self, address, pool_size=4, max_batch=64):
+		self.address = address
+		self.pool_size = pool_size
+		self.max_batch = max_batch
+		self._connections = []
+		self._reconnecting = asyncio.Lock()
+
+	async def connect(self):
+		for _ in range(self.pool_size - len(self._connections)):
+			if isinstance(self.address, str):
+				reader, writer = await asyncio.open_unix_connection(self.address)
+			else:
+				reader, writer = await asyncio.open_connection(*self.address)
+			self._connections.append(_Connection(reader, writer, self.max_batch))
+		return self
+
+	async def _call(self, method):
+		dead = [c for c in self._connections if c.closed is not None]
+		if dead:
+			self._connections = [c for c in self._connections if c.closed is None]
+			await asyncio.gather(*(c.close() for c in dead))
+		if not self._connections:
+			async with self._reconnecting: #Only one caller reconnects, the others then use its connections
+				if not self._connections:
+					try:
+						await self.connect()
+					except OSError as e:
+						raise RemoteError("cannot reconnect: {!r}".format(e)) from e
+
+		#Use the connection with the fewest calls in flight
+		connection = min(self._connections, key=lambda c: c.in_flight)
+		return await connection.call(method)
+
+	async def produce(self):
+		return await self._call("produce")
+
+	async def meet(self):
+		return await self._call("meet")
+
+	def stats(self):
+		calls = sum(c.calls_sent for c in self._connections)
+		batches = sum(c.batches_sent for c in self._connections)
+		return {"connections": len(self._connections), "calls": calls, "batches": batches,
+		        "average_batch": calls / batches if batches else 0.0}
+
+	async def close(self):
+		await asyncio.gather(*(c.close() for c in self._connections))
+		self._connections = []
+
+	async def __aenter__(self):
+		return await self.connect()
+
+	async def __aexit__(self, *exc):
+		await self.close()
+
+async def meet_remote_producer(address):
+	async with RemoteProducerProxy(address, pool_size=2) as remote:
+		await remote.meet() #Printed by the server process
+		await asyncio.gather(*(remote.produce() for _ in range(3)))
+
+if __name__ == "__main__":
+	with ProducerServer() as server:
+		asyncio.run(meet_remote_producer(server.address))
+
 """ChatGPTExample:
     Let's take an example of an image viewer application that 
     loads high-resolution images. To improve the performance, 
@@ -86,20 +459,154 @@ class HighResImageViewer(ImageViewer):
 
     def _load_image(self):
         print(f"Loading high-resolution image from {self._image_path}")
+        self._mmap = None
+        self.pixels = memoryview(b"")  # Stays empty if the file doesn't exist
+
+        if os.path.exists(self._image_path) and os.path.getsize(self._image_path) > 0:
+            # Map the file instead of reading it: the OS pages it in on demand and
+            # nothing is copied into the Python heap
+            with open(self._image_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.pixels = memoryview(self._mmap)
+
+        # Bytes this viewer keeps in memory
+        self.nbytes = self.pixels.nbytes
+
+    def warm(self):
+        """Ask the OS to start reading the pages in before they are displayed"""
+        if self._mmap is not None and hasattr(self._mmap, "madvise"):
+            self._mmap.madvise(mmap.MADV_WILLNEED)
+
+    def close(self):
+        self.pixels.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
 
     def display_image(self):
         print(f"Displaying high-resolution image from {self._image_path}")
 
+# Shared cache of loaded RealSubjects
+class ViewerCache:
+    """LRU cache of HighResImageViewer objects keyed by image path, limited to max_bytes"""
+
+    def __init__(self, max_bytes, loader=HighResImageViewer, sizeof=lambda viewer: viewer.nbytes):
+        self.max_bytes = max_bytes
+        self._loader = loader
+        self._sizeof = sizeof
+        self._viewers = OrderedDict()  # image_path -> (viewer, size), least recently used first
+        self._lock = threading.Lock()
+        self._loading = {}  # image_path -> [Event set once loaded, viewer], for paths being loaded right now
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # Misses that waited for another thread's load instead of loading again
+        self.evictions = 0
+        self._prefetcher = None
+
+    def get(self, image_path):
+        while True:
+            with self._lock:
+                entry = self._viewers.get(image_path)
+                if entry is not None:
+                    self._viewers.move_to_end(image_path)
+                    self.hits += 1
+                    return entry[0]
+                loading = self._loading.get(image_path)
+                if loading is None:  # Nobody is loading it: this thread does
+                    self.misses += 1
+                    loading = self._loading[image_path] = [threading.Event(), None]
+                    break
+                self.coalesced += 1
+
+            # Another thread (often the prefetch pool) is already loading it: wait for that viewer
+            loading[0].wait()
+            if loading[1] is not None:
+                return loading[1]
+            # That load failed: try again, possibly loading it ourselves
+
+        # Load outside the lock so other paths are not held up by a slow load
+        try:
+            viewer = self._loader(image_path)
+            size = self._sizeof(viewer)
+        except BaseException:
+            with self._lock:
+                del self._loading[image_path]
+            loading[0].set()
+            raise
+
+        with self._lock:
+            self._viewers[image_path] = (viewer, size)
+            self.current_bytes += size
+            self._evict()
+            del self._loading[image_path]
+        loading[1] = viewer
+        loading[0].set()
+        return viewer
+
+    def _evict(self):
+        # Never evict the entry that was just added, even if it alone is over budget
+        while self.current_bytes > self.max_bytes and len(self._viewers) > 1:
+            _, (_, size) = self._viewers.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+
+    def __contains__(self, image_path):
+        return image_path in self._viewers
+
+    def __len__(self):
+        return len(self._viewers)
+
+    @property
+    def prefetcher(self):
+        """The PrefetchPool that warms this cache, created the first time it is needed"""
+        with self._lock:
+            if self._prefetcher is None:
+                self._prefetcher = PrefetchPool(self)
+            return self._prefetcher
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced, "evictions": self.evictions,
+                    "entries": len(self._viewers), "bytes": self.current_bytes, "max_bytes": self.max_bytes}
+
+# Background loader
+class PrefetchPool:
+    """Loads upcoming images into a ViewerCache on worker threads"""
+
+    def __init__(self, cache, workers=4):
+        self._cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    def _warm_one(self, image_path):
+        viewer = self._cache.get(image_path)
+        if hasattr(viewer, "warm"):
+            viewer.warm()
+        return viewer
+
+    def warm(self, image_paths):
+        """Start loading image_paths in the background, returns one future per path"""
+        return [self._pool.submit(self._warm_one, path) for path in image_paths if path not in self._cache]
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+# Cache shared by every proxy that doesn't bring its own
+default_viewer_cache = ViewerCache(max_bytes=512 * 1024 * 1024)
+
 # Proxy
 class ProxyImageViewer(ImageViewer):
-    def __init__(self, image_path):
+    def __init__(self, image_path, cache=None):
         self._image_path = image_path
-        self._real_viewer = None
+        self._cache = cache if cache is not None else default_viewer_cache
 
     def display_image(self):
-        if not self._real_viewer:
-            self._real_viewer = HighResImageViewer(self._image_path)
-        self._real_viewer.display_image()
+        # Proxies for the same path share one viewer; an evicted viewer is simply loaded again
+        self._cache.get(self._image_path).display_image()
+
+    def prefetch(self, image_paths):
+        """Warm the images the user is likely to look at next (e.g. the next gallery page)"""
+        return self._cache.prefetcher.warm(image_paths)
 
 # Usage
 image_path = "image.jpg"
@@ -111,12 +618,148 @@ proxy_viewer.display_image()  # Output: Loading high-resolution image from image
 # The second time we display the image, it uses the cached RealSubject
 proxy_viewer.display_image()  # Output: Displaying high-resolution image from image.jpg
 
+# A second proxy for the same path reuses the already loaded viewer
+ProxyImageViewer(image_path).display_image()  # Output: Displaying high-resolution image from image.jpg
+
+# With a byte budget, the least recently displayed image is dropped first
+# (here every image counts as one byte, so the cache holds two of them)
+small_cache = ViewerCache(max_bytes=2, sizeof=lambda viewer: 1)
+for path in ["a.jpg", "b.jpg", "a.jpg", "c.jpg", "b.jpg"]:
+    ProxyImageViewer(path, cache=small_cache).display_image()  # b.jpg is loaded again after being evicted
+print(small_cache.stats())
+
+# Real files are memory-mapped: pixels is a memoryview over the file, not a copy of it
+with tempfile.TemporaryDirectory() as gallery:
+    paths = []
+    for i in range(3):
+        paths.append(os.path.join(gallery, f"photo{i}.raw"))
+        with open(paths[-1], "wb") as f:
+            f.write(bytes(range(256)) * 16)
+
+    gallery_cache = ViewerCache(max_bytes=64 * 1024)
+    first = ProxyImageViewer(paths[0], cache=gallery_cache)
+    for future in first.prefetch(paths[1:]):  # Load the next photos in the background
+        future.result()
+    first.display_image()
+    print(gallery_cache.stats())  # Each photo was loaded once, two of them in the background
+    gallery_cache.prefetcher.shutdown()
+    for path in paths:
+        gallery_cache.get(path).close()
+
 """
     In this example, ImageViewer is the subject interface, HighResImageViewer is 
     the real subject that loads the high-resolution image, and ProxyImageViewer is 
     the proxy that acts as a placeholder for the real subject. When the display_image()
-    method is called on the ProxyImageViewer, it checks if the real viewer exists. If not,
-    it creates the HighResImageViewer (real subject) and then delegates the method call to it.
-    Subsequent calls to display_image() reuse the cached real viewer, improving performance by
-    loading the image only when needed.
-    """
\ No newline at end of file
+    method is called on the ProxyImageViewer, it asks the shared ViewerCache for the real viewer.
+    If the cache doesn't have it, the HighResImageViewer (real subject) is created and the method
+    call is delegated to it. Subsequent calls to display_image(), from this proxy or any other proxy
+    for the same path, reuse the cached real viewer, improving performance by loading the image only
+    when needed. The cache keeps its total size under max_bytes by evicting the least recently used
+    viewers; an evicted image is simply loaded again the next time it is displayed.
+    """
+
+
+def benchmark_async_proxy(callers=1000, threads=100):
+	"""Throughput of `callers` concurrent guests: sleeping Proxy on a thread pool vs AsyncProxy"""
+	def sleeping_call(_):
+		Proxy().produce()
+
+	with contextlib.redirect_stdout(io.StringIO()): #Don't time the prints
+		start = time.perf_counter()
+		with ThreadPoolExecutor(max_workers=threads) as pool:
+			list(pool.map(sleeping_call, range(callers)))
+		sync_elapsed = time.perf_counter() - start
+
+		async def run_async():
+			ap = AsyncProxy()
+			await asyncio.gather(*(ap.produce() for _ in range(callers)))
+
+		start = time.perf_counter()
+		asyncio.run(run_async())
+		async_elapsed = time.perf_counter() - start
+
+	print("Proxy      ({} threads): {} callers in {:.2f}s -> {:.1f} calls/s".format(threads, callers, sync_elapsed, callers / sync_elapsed))
+	print("AsyncProxy (1 thread)  : {} callers in {:.2f}s -> {:.1f} calls/s".format(callers, async_elapsed, callers / async_elapsed))
+
+def benchmark_image_loading(size_mb=512, repeat=3):
+	"""Load a size_mb file with mmap (HighResImageViewer) vs read() into bytes"""
+	page = mmap.PAGESIZE
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, "huge.raw")
+		with open(path, "wb") as f:
+			chunk = os.urandom(1024 * 1024)
+			for _ in range(size_mb):
+				f.write(chunk)
+
+		def load_mmap():
+			with contextlib.redirect_stdout(io.StringIO()):
+				viewer = HighResImageViewer(path)
+			pixels = viewer.pixels
+			touched = bytes(pixels[::page]) #Touch one byte per page so the whole file is really read
+			viewer.close()
+			return touched
+
+		def load_read():
+			with open(path, "rb") as f:
+				pixels = f.read()
+			return pixels[::page]
+
+		for name, load in (("mmap + memoryview", load_mmap), ("read() into bytes", load_read)):
+			best = float("inf")
+			for _ in range(repeat):
+				tracemalloc.start()
+				start = time.perf_counter()
+				load()
+				best = min(best, time.perf_counter() - start)
+				peak = tracemalloc.get_traced_memory()[1]
+				tracemalloc.stop()
+			print("{:18}: {} MB in {:.3f}s ({:.0f} MB/s), Python heap peak {:.1f} MB".format(
+				name, size_mb, best, size_mb / best, peak / (1024 * 1024)))
+
+def benchmark_lazy_proxy(number=1000000):
+	"""Per-call cost of a method forwarded through lazy_proxy vs calling it directly"""
+	direct = SlowToBuild()
+	lazy = lazy_proxy(SlowToBuild)
+	lazy.ping() #Build the subject and cache the bound method
+
+	direct_time = min(timeit.repeat(direct.ping, number=number, repeat=5))
+	lazy_time = min(timeit.repeat(lambda: lazy.ping(), number=number, repeat=5))
+	bound_time = min(timeit.repeat(lambda: direct.ping(), number=number, repeat=5))
+
+	print("direct call       : {:.1f} ns".format(direct_time / number * 1e9))
+	print("direct obj.ping() : {:.1f} ns".format(bound_time / number * 1e9))
+	print("lazy_proxy.ping() : {:.1f} ns".format(lazy_time / number * 1e9))
+
+def benchmark_remote_producer(pool_sizes=(1, 4, 8), concurrencies=(1, 16, 256), calls=5000):
+	"""Load generator: latency and throughput of RemoteProducerProxy as pool size and concurrency vary"""
+	async def run(address, pool_size, concurrency):
+		latencies = []
+		remaining = iter(range(calls))
+
+		async def worker(remote):
+			for _ in remaining: #Workers share the call budget
+				start = time.perf_counter()
+				await remote.produce()
+				latencies.append(time.perf_counter() - start)
+
+		async with RemoteProducerProxy(address, pool_size=pool_size) as remote:
+			start = time.perf_counter()
+			await asyncio.gather(*(worker(remote) for _ in range(concurrency)))
+			elapsed = time.perf_counter() - start
+			average_batch = remote.stats()["average_batch"]
+
+		percentiles = statistics.quantiles(latencies, n=100)
+		print("pool {:2} | concurrency {:4} | {:8.0f} req/s | p50 {:7.3f} ms | p99 {:7.3f} ms | batch {:5.1f}".format(
+			pool_size, concurrency, calls / elapsed, percentiles[49] * 1e3, percentiles[98] * 1e3, average_batch))
+
+	with ProducerServer(quiet=True) as server:
+		for pool_size in pool_sizes:
+			for concurrency in concurrencies:
+				asyncio.run(run(server.address, pool_size, concurrency))
+
+# Benchmark (run with: python Proxy.py --bench)
+if __name__ == "__main__" and "--bench" in sys.argv:
+	benchmark_async_proxy()
+	benchmark_image_loading()
+	benchmark_lazy_proxy()
+	benchmark_remote_producer()
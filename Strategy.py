@@ -22,7 +22,21 @@
     representing various algorithms or behaviors.
     Each concrete strategy provides its own implementation of the common method(s)."""
 
+import heapq
+import inspect
+import random
+import statistics
+import sys
+import threading
+import time
+import timeit
 import types #Import the types module
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+try:
+    import numpy #Optional: only used for vectorized execute_many() kernels
+except ImportError:
+    numpy = None
 
 class Strategy:
     """The Strategy Pattern class"""
@@ -38,6 +52,15 @@ class Strategy:
         """The defaut method that prints the name of the strategy being used"""
         print("{} is used!".format(self.name))
 
+    def execute_many(self, inputs):
+        """Run the strategy on a whole batch of inputs (only for strategies whose execute() takes a value)"""
+        execute = self.execute
+        try:
+            inspect.signature(execute).bind(None)
+        except TypeError:
+            raise TypeError("{} takes no value, so it can't run a batch of inputs".format(self.name)) from None
+        return [execute(value) for value in inputs]
+
 #Replacement method 1
 def strategy_one(self):
     print("{} is used to execute method 1".format(self.name))
@@ -60,4 +83,304 @@ s1.execute()
 
 s2 = Strategy(strategy_two)
 s2.name = "Strategy Two"
-s2.execute()
\ No newline at end of file
+s2.execute()
+
+"""Adaptive strategy selection:
+    Instead of choosing the strategy by hand, a StrategyRegistry holds several
+    interchangeable implementations of the same operation, times them on the
+    real calls it receives, and sends every call to the implementation that
+    has been fastest so far for inputs of that size. Every now and then it
+    tries the other ones again, in case things have changed."""
+
+class StrategyRegistry(Strategy):
+    """A Strategy whose execute() picks the fastest registered implementation per input size"""
+
+    def __init__(self, name="Adaptive Strategy", size_of=len, warmup=3, explore_every=100, smoothing=0.2):
+        Strategy.__init__(self)
+        self.name = name
+        self._size_of = size_of #How big is an input? (applied to the first argument)
+        self._warmup = warmup #Calls every strategy gets in a bucket before we start choosing
+        self._explore_every = explore_every #Every n-th call in a bucket tries the least sampled strategy
+        self._smoothing = smoothing #Weight of the newest timing in the moving average
+        self._strategies = {}
+        self._timings = {} #bucket -> {strategy name -> [calls, total seconds, moving average]}
+        self._calls = {} #bucket -> number of calls
+        self._lock = threading.Lock()
+
+    def register(self, function=None, name=None):
+        """Add an implementation; can also be used as a decorator"""
+        if function is None:
+            return lambda function: self.register(function, name)
+        self._strategies[name or function.__name__] = function
+        return function
+
+    @staticmethod
+    def bucket_of(size):
+        """Inputs are grouped in power-of-two size buckets: 0, 1, 2-3, 4-7, 8-15, ..."""
+        return size.bit_length()
+
+    def _choose(self, bucket):
+        timings = self._timings.setdefault(bucket, {})
+        calls = self._calls[bucket] = self._calls.get(bucket, 0) + 1
+
+        #Make sure every strategy has been measured a few times
+        for name in self._strategies:
+            if name not in timings or timings[name][0] < self._warmup:
+                return name, "warmup"
+
+        #Now and then, give the least measured one another chance
+        if self._explore_every and calls % self._explore_every == 0:
+            return min(self._strategies, key=lambda name: timings[name][0]), "explore"
+
+        return min(self._strategies, key=lambda name: timings[name][2]), "fastest"
+
+    def execute(self, *args, **kwargs):
+        if not self._strategies:
+            raise LookupError("No strategy registered in {}".format(self.name))
+
+        bucket = self.bucket_of(self._size_of(args[0]))
+        with self._lock:
+            name, _ = self._choose(bucket)
+
+        start = time.perf_counter()
+        result = self._strategies[name](*args, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            timing = self._timings[bucket].setdefault(name, [0, 0.0, elapsed])
+            timing[0] += 1
+            timing[1] += elapsed
+            timing[2] += self._smoothing * (elapsed - timing[2])
+        return result
+
+    def best(self, size):
+        """The strategy execute() would currently use for an input of this size (None if unknown)"""
+        timings = self._timings.get(self.bucket_of(size))
+        if not timings:
+            return None
+        return min(timings, key=lambda name: timings[name][2])
+
+    @property
+    def strategies(self):
+        """The registered implementations, by name"""
+        return dict(self._strategies)
+
+    def report(self):
+        """Decisions and timings per size bucket, for inspection"""
+        with self._lock:
+            report = {}
+            for bucket in sorted(self._timings):
+                sizes = (0, 0) if bucket == 0 else (1 << (bucket - 1), (1 << bucket) - 1)
+                timings = self._timings[bucket]
+                report[sizes] = {
+                    "calls": self._calls.get(bucket, 0),
+                    "chosen": min(timings, key=lambda name: timings[name][2]),
+                    "timings": {name: {"calls": calls, "mean": total / calls, "recent": recent}
+                                for name, (calls, total, recent) in timings.items()},
+                }
+            return report
+
+#Two interchangeable ways of finding the three smallest values
+def smallest_by_sorting(data):
+    return sorted(data)[:3]
+
+def smallest_by_heap(data):
+    return heapq.nsmallest(3, data)
+
+smallest = StrategyRegistry("Three Smallest")
+smallest.register(smallest_by_sorting)
+smallest.register(smallest_by_heap)
+
+#Feed it real calls of different sizes
+for size in (10, 10000):
+    for _ in range(50):
+        smallest.execute([random.random() for _ in range(size)])
+
+for sizes, decision in smallest.report().items():
+    print("Sizes {}-{}: {} chosen after {} calls".format(sizes[0], sizes[1], decision["chosen"], decision["calls"]))
+    for name, timing in decision["timings"].items():
+        print("    {:20} {:4} calls, mean {:.2f} us".format(name, timing["calls"], timing["mean"] * 1e6))
+
+
+"""Lightweight strategies:
+    Strategy(function) creates a new bound method for every instance. When millions
+    of short-lived strategies are created, that allocation adds up. LightStrategy
+    puts the function on a class instead (one class per function, created once and
+    cached), and its instances use __slots__, so creating one only stores its name.
+    A strategy can also come with a kernel that handles a whole batch at once in
+    execute_many(), for example a NumPy-vectorized one."""
+
+class LightStrategy:
+    """Strategy with the behaviour on the class and __slots__ instances"""
+    __slots__ = ("name",)
+
+    _classes = {} #(base class, function, kernel) -> generated strategy class
+
+    def __init__(self, name="Default Strategy"):
+        self.name = name
+
+    def execute(self, value=None):
+        """The default method that prints the name of the strategy being used"""
+        print("{} is used!".format(self.name))
+
+    def execute_many(self, inputs):
+        """Run the strategy on a whole batch of inputs, one execute() call per input"""
+        execute = self.execute
+        return [execute(value) for value in inputs]
+
+    @classmethod
+    def for_function(cls, function, kernel=None):
+        """Return the strategy class that runs `function`, creating it the first time
+
+        `kernel(self, array)` is optional: when NumPy is available, execute_many()
+        turns the inputs into an array and hands the whole batch to it."""
+        key = (cls, function, kernel)
+        strategy_class = cls._classes.get(key)
+        if strategy_class is None:
+            attributes = {"__slots__": (), "execute": function}
+            if kernel is not None and numpy is not None:
+                attributes["execute_many"] = lambda self, inputs: kernel(self, numpy.asarray(inputs))
+            strategy_class = type(function.__name__, (cls,), attributes)
+            cls._classes[key] = strategy_class
+        return strategy_class
+
+#A strategy with a single-value version and a vectorized version
+def to_fahrenheit(self, celsius):
+    return celsius * 9 / 5 + 32
+
+def to_fahrenheit_kernel(self, celsius):
+    return celsius * 9 / 5 + 32 #Same formula, applied to the whole array at once
+
+Fahrenheit = LightStrategy.for_function(to_fahrenheit, to_fahrenheit_kernel)
+s3 = Fahrenheit("Fahrenheit Strategy")
+print("{} turns 25 into {}".format(s3.name, s3.execute(25)))
+print("{} turns [0, 100] into {}".format(s3.name, [float(value) for value in s3.execute_many([0, 100])]))
+
+#The class is created once: asking again returns the same one
+print(LightStrategy.for_function(to_fahrenheit, to_fahrenheit_kernel) is Fahrenheit) #True
+
+"""Hedged strategies:
+    When latency matters more than CPU, two or more interchangeable strategies can
+    race each other: they run at the same time in a thread or process pool and the
+    first one that succeeds wins. With a hedge delay, the backup strategies are only
+    started if the first one hasn't answered within that time, which cuts the slow
+    tail without doubling the work for every call."""
+
+class HedgedStrategy(Strategy):
+    """A Strategy whose execute() races several implementations and returns the first success"""
+
+    def __init__(self, functions, executor=None, hedge_delay=None, name="Hedged Strategy"):
+        Strategy.__init__(self)
+        self.name = name
+        if isinstance(functions, StrategyRegistry):
+            functions = functions.strategies.values()
+        self._functions = list(functions) #In order of preference: the first one always starts right away
+        if not self._functions:
+            raise ValueError("HedgedStrategy needs at least one function")
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=4 * len(self._functions))
+        self.hedge_delay = hedge_delay #None: start them all at once
+        self.wins = [0] * len(self._functions) #Per function, by position: names may repeat (lambdas, replicas)
+        self.hedges = 0 #Calls where the backups had to be started
+
+    def execute(self, *args, **kwargs):
+        submit = self._executor.submit
+        futures = {submit(self._functions[0], *args, **kwargs): 0}
+        backups = self._functions[1:]
+
+        if backups and self.hedge_delay is not None:
+            done, _ = wait(futures, timeout=self.hedge_delay)
+            if any(future.exception() is None for future in done):
+                backups = [] #The first one answered in time
+        if backups:
+            self.hedges += 1
+            for position, function in enumerate(backups, 1):
+                futures[submit(function, *args, **kwargs)] = position
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    #We have a winner: cancel the others. Losers that are already running
+                    #can't be interrupted, they finish in the background and are ignored.
+                    for loser in pending:
+                        loser.cancel()
+                    self.wins[futures[future]] += 1
+                    return future.result()
+                error = future.exception()
+        raise error #Every strategy failed
+
+    def close(self):
+        if self._own_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+#Two replicas of the same work: usually quick, but now and then very slow
+def variable_cost(value, slow_chance=0.05):
+    time.sleep(0.05 if random.random() < slow_chance else 0.001)
+    return value * 2
+
+def variable_cost_replica(value, slow_chance=0.05):
+    return variable_cost(value, slow_chance)
+
+with HedgedStrategy([variable_cost, variable_cost_replica], hedge_delay=0.005) as hedged:
+    print("{} returns {}".format(hedged.name, [hedged.execute(value) for value in range(5)]))
+
+def benchmark_hedged_strategy(calls=1000, hedge_delay=0.003, processes=False):
+    """p50/p99 latency of one strategy alone vs racing vs hedging two replicas"""
+    def measure(execute):
+        latencies = []
+        for value in range(calls):
+            start = time.perf_counter()
+            execute(value)
+            latencies.append(time.perf_counter() - start)
+        percentiles = statistics.quantiles(latencies, n=100)
+        return percentiles[49] * 1e3, percentiles[98] * 1e3
+
+    executor = ProcessPoolExecutor(max_workers=4) if processes else ThreadPoolExecutor(max_workers=8)
+    with executor:
+        replicas = [variable_cost, variable_cost_replica]
+        alone = HedgedStrategy(replicas[:1], executor=executor)
+        racing = HedgedStrategy(replicas, executor=executor)
+        hedged = HedgedStrategy(replicas, executor=executor, hedge_delay=hedge_delay)
+        for label, strategy in (("single strategy", alone), ("race both", racing),
+                                ("hedge after {:.0f} ms".format(hedge_delay * 1e3), hedged)):
+            p50, p99 = measure(strategy.execute)
+            print("{:18}: p50 {:6.2f} ms | p99 {:6.2f} ms | backups started on {:4.1f}% of calls".format(
+                label, p50, p99, 100.0 * strategy.hedges / calls))
+
+def benchmark_light_strategy(count=1000000):
+    """Create-and-call cost of Strategy (types.MethodType) vs LightStrategy, and batch execution"""
+    def create_and_call_strategy():
+        for value in range(count):
+            Strategy(to_fahrenheit).execute(value)
+
+    def create_and_call_light():
+        for value in range(count):
+            Fahrenheit().execute(value)
+
+    inputs = list(range(count))
+    single = Fahrenheit()
+    results = [
+        ("Strategy(function)      create + execute", create_and_call_strategy),
+        ("LightStrategy           create + execute", create_and_call_light),
+        ("LightStrategy           execute per value", lambda: [single.execute(value) for value in inputs]),
+        ("LightStrategy           execute_many", lambda: single.execute_many(inputs)),
+    ]
+    for label, run in results:
+        best = min(timeit.repeat(run, number=1, repeat=3))
+        print("{}: {:.1f} ns per value".format(label, best / count * 1e9))
+    if numpy is None:
+        print("(NumPy isn't installed, so execute_many ran the per-value fallback)")
+
+# Benchmark (run with: python Strategy.py --bench)
+if __name__ == "__main__" and "--bench" in sys.argv:
+    benchmark_light_strategy()
+    benchmark_hedged_strategy()
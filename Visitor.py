@@ -25,6 +25,15 @@
     the visitor can visit. It provides a way to iterate through the elements and call 
     their accept method."""
 
+import functools
+import itertools
+import operator
+import os
+import sys
+import time
+import timeit
+from concurrent.futures import ProcessPoolExecutor
+
 class House(object): #The class being visited 
 	def accept(self, visitor):
 		"""Interface to accept a visitor"""
@@ -72,3 +81,329 @@ home.accept(hv)
 
 #Let the house accept the electrician and work on the house by invoking the visit() method
 home.accept(e)
+
+
+"""Cached dispatch:
+    With accept()/visit() every element costs two calls, and every new element type
+    needs its own work_on_*() method. A DispatchVisitor instead has one visit_<ElementClass>()
+    method per element type it handles. The right method is looked up through the element's
+    class hierarchy (MRO) only once per (visitor class, element class) pair and remembered,
+    so visiting an element afterwards is one dict lookup plus one call."""
+
+
+class _DispatchTable(dict):
+	"""element class -> visit function for one visitor class, filled in on first use"""
+	def __init__(self, visitor_class):
+		self._visitor_class = visitor_class
+
+	def __missing__(self, element_class):
+		"""Walk the element's MRO once, so an Apartment is handled by visit_House() if there is no visit_Apartment()"""
+		for klass in element_class.__mro__:
+			method = getattr(self._visitor_class, "visit_" + klass.__name__, None)
+			if method is not None:
+				break
+		else:
+			method = self._visitor_class.generic_visit
+		self[element_class] = method
+		return method
+
+
+class DispatchVisitor(Visitor):
+	"""Visitor that finds its visit_<ElementClass>() methods itself"""
+	interests = None #Optionally, a tuple of the element classes this visitor cares about
+
+	def __init_subclass__(cls, **kwargs):
+		super().__init_subclass__(**kwargs)
+		cls._dispatch = _DispatchTable(cls) #Every visitor class gets its own table
+
+	def visit(self, element):
+		return self._dispatch[element.__class__](self, element)
+
+	def visit_all(self, elements):
+		"""Visit every element: one dict lookup and one call each"""
+		dispatch = self._dispatch
+		return [dispatch[element.__class__](self, element) for element in elements]
+
+	def generic_visit(self, element):
+		raise TypeError("{} doesn't know how to visit {}".format(self, element))
+
+	@classmethod
+	def handles(cls, element_class):
+		"""Does this visitor want to see elements of element_class at all?"""
+		if cls.interests is not None and not issubclass(element_class, cls.interests):
+			return False
+		if cls.batch_method(element_class) is not None:
+			return True
+		return cls._dispatch[element_class] is not DispatchVisitor.generic_visit
+
+	@classmethod
+	def batch_method(cls, element_class):
+		"""The visit_many_<ElementClass>() method that takes a whole list of elements, if any"""
+		for klass in element_class.__mro__:
+			method = getattr(cls, "visit_many_" + klass.__name__, None)
+			if method is not None:
+				return method
+		return None
+
+
+DispatchVisitor._dispatch = _DispatchTable(DispatchVisitor)
+
+
+class Apartment(House): #Handled by visit_House() unless a visitor has visit_Apartment()
+	pass
+
+
+class Office(House):
+	pass
+
+
+class Inspector(DispatchVisitor):
+	"""Concrete visitor: one method per element type, no work_on_*() needed in the elements"""
+	def visit_House(self, house):
+		return "{} inspected by {}".format(house, self)
+
+	def visit_Office(self, office):
+		return "{} inspected for fire safety by {}".format(office, self)
+
+
+inspector = Inspector()
+for line in inspector.visit_all([House(), Apartment(), Office()]):
+	print(line)
+
+#A single element can be visited directly too
+print(inspector.visit(home))
+
+
+"""Fused traversal:
+    Running several visitors one after the other means one full pass over the elements
+    per visitor. The ObjectStructure below keeps its elements in one column (list) per
+    element class and runs any number of visitors in a single pass. For every column it
+    first works out which visitors care about that class and which method they use, so
+    elements nobody is interested in are skipped without a single call, and a visitor with
+    a visit_many_<ElementClass>() method gets the whole column in one call."""
+
+class ObjectStructure(object):
+	"""Collection of elements, stored column by column, that several visitors can visit at once"""
+	def __init__(self, elements=()):
+		self._columns = {} #element class -> list of the elements of exactly that class
+		self.extend(elements)
+
+	def add(self, element):
+		column = self._columns.get(element.__class__)
+		if column is None:
+			column = self._columns[element.__class__] = []
+		column.append(element)
+
+	def extend(self, elements):
+		for element in elements:
+			self.add(element)
+
+	def __len__(self):
+		return sum(len(column) for column in self._columns.values())
+
+	def __iter__(self):
+		"""Elements come out grouped by class, not in the order they were added"""
+		for column in self._columns.values():
+			yield from column
+
+	def columns(self):
+		return dict(self._columns)
+
+	def parallel_visit(self, visitor, reduce, initial=None, workers=None, chunk_size=10000):
+		"""Visit every element in a process pool and merge the results, see parallel_visit()"""
+		return parallel_visit(visitor, self, reduce, initial, workers, chunk_size)
+
+	def accept_all(self, *visitors):
+		"""Run every visitor over every element it is interested in, in one pass.
+		Visitors keep their own results (counts, reports, ...)."""
+		for element_class, column in self._columns.items():
+			calls = [] #(method, visitor) pairs that want every element of this column
+			for visitor in visitors:
+				if not visitor.handles(element_class):
+					continue #Skipped for the whole column, no call at all
+				batch = visitor.batch_method(element_class)
+				if batch is not None:
+					batch(visitor, column) #One call for the whole column
+				else:
+					calls.append((visitor._dispatch[element_class], visitor))
+
+			if len(calls) == 1:
+				method, visitor = calls[0]
+				for element in column:
+					method(visitor, element)
+			elif calls:
+				for element in column:
+					for method, visitor in calls:
+						method(visitor, element)
+
+
+class HvacAudit(DispatchVisitor):
+	"""Counts every building's HVAC unit"""
+	units = 0
+
+	def visit_House(self, house):
+		self.units += 1
+
+
+class FireSafetyAudit(DispatchVisitor):
+	"""Only offices are inspected for fire safety"""
+	interests = (Office,)
+	inspected = 0
+
+	def visit_many_Office(self, offices):
+		self.inspected += len(offices) #The whole column at once
+
+
+neighborhood = ObjectStructure([House(), Apartment(), Office(), House()])
+hvac_audit, fire_audit = HvacAudit(), FireSafetyAudit()
+neighborhood.accept_all(hvac_audit, fire_audit) #One pass for both visitors
+print("{} HVAC units, {} offices inspected for fire safety".format(hvac_audit.units, fire_audit.inspected))
+
+
+"""Parallel visiting:
+    A visitor that returns values instead of printing them can be run on many elements
+    at once. parallel_visit() cuts the elements into chunks and sends them to a pool of
+    worker processes (the visitor and the elements must be picklable). Every worker
+    visits its chunk and folds the results with `reduce`, and the partial results are
+    then folded the same way. Since chunks are merged in a different grouping than a
+    serial run would use, `reduce` must be associative, like operator.add or max."""
+
+def _visit_chunk(visitor, chunk, reduce):
+	"""Runs in a worker: returns (True, merged results), or (False, None) if nothing came back"""
+	results = visitor.visit_all(chunk)
+	if not results:
+		return False, None
+	return True, functools.reduce(reduce, results)
+
+def _chunks(elements, chunk_size):
+	elements = iter(elements)
+	while True:
+		chunk = list(itertools.islice(elements, chunk_size))
+		if not chunk:
+			return
+		yield chunk
+
+def parallel_visit(visitor, elements, reduce, initial=None, workers=None, chunk_size=10000):
+	"""Visit elements with `visitor` in `workers` processes and merge everything with `reduce`"""
+	partials = []
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		for found, partial in pool.map(_visit_chunk, itertools.repeat(visitor), _chunks(elements, chunk_size), itertools.repeat(reduce)):
+			if found:
+				partials.append(partial)
+	if initial is not None:
+		partials.insert(0, initial)
+	if not partials:
+		raise ValueError("parallel_visit() of no elements needs an initial value")
+	return functools.reduce(reduce, partials)
+
+
+class EnergyModel(DispatchVisitor):
+	"""CPU-heavy visitor: simulates a day of energy use and returns it instead of printing"""
+	def __init__(self, hours=24, steps=200):
+		self.hours = hours
+		self.steps = steps
+
+	def visit_House(self, house):
+		usage = 0.0
+		for step in range(self.hours * self.steps):
+			usage += (step % 7) * 0.01
+		return usage
+
+	def visit_Office(self, office):
+		return 2 * self.visit_House(office)
+
+
+if __name__ == "__main__":
+	town = ObjectStructure([House(), Apartment(), Office()] * 10)
+	total = town.parallel_visit(EnergyModel(), operator.add, workers=2, chunk_size=8)
+	print("The town uses {:.1f} units of energy a day".format(total))
+
+
+def benchmark_dispatch_visitor(count=1000000):
+	"""accept()/visit()/work_on_*() vs DispatchVisitor.visit_all() over a mixed neighborhood"""
+	class CountingHouse(House):
+		def work_on_hvac(self, hvac_specialist):
+			hvac_specialist.count += 1
+
+	class CountingApartment(CountingHouse):
+		pass
+
+	class CountingOffice(CountingHouse):
+		pass
+
+	class CountingHvac(HvacSpecialist):
+		count = 0
+
+	class HvacDispatch(DispatchVisitor):
+		count = 0
+
+		def visit_CountingHouse(self, house):
+			self.count += 1
+
+	kinds = [CountingHouse, CountingApartment, CountingOffice]
+	neighborhood = [kinds[i % 3]() for i in range(count)]
+
+	def classic():
+		hvac = CountingHvac()
+		for house in neighborhood:
+			house.accept(hvac)
+
+	def dispatched():
+		HvacDispatch().visit_all(neighborhood)
+
+	for label, run in (("accept/visit", classic), ("DispatchVisitor", dispatched)):
+		best = min(timeit.repeat(run, number=1, repeat=3))
+		print("{:16}: {:.3f}s for {} elements ({:.0f} ns each)".format(label, best, count, best / count * 1e9))
+
+def benchmark_fused_visitors(count=300000, analyses=24):
+	"""`analyses` visitors over a mixed neighborhood: one visit_all() pass each vs one fused pass"""
+	def make_analysis(index):
+		#Every third analysis only looks at offices, the rest at every building
+		if index % 3 == 0:
+			methods = {"interests": (Office,), "visit_Office": lambda self, office: None}
+		else:
+			methods = {"visit_House": lambda self, house: None}
+		return type("Analysis{}".format(index), (DispatchVisitor,), methods)()
+
+	kinds = [House, Apartment, Office]
+	elements = [kinds[i % 3]() for i in range(count)]
+	structure = ObjectStructure(elements)
+	visitors = [make_analysis(i) for i in range(analyses)]
+
+	def one_pass_each():
+		for visitor in visitors:
+			if visitor.interests is None:
+				visitor.visit_all(elements)
+			else:
+				visitor.visit_all([element for element in elements if isinstance(element, visitor.interests)])
+
+	def fused():
+		structure.accept_all(*visitors)
+
+	for label, run in (("one pass per visitor", one_pass_each), ("fused ObjectStructure", fused)):
+		best = min(timeit.repeat(run, number=1, repeat=3))
+		print("{:21}: {:.3f}s for {} visitors x {} elements".format(label, best, analyses, count))
+
+def benchmark_parallel_visit(count=6000, chunk_size=200):
+	"""Scaling of parallel_visit() with a CPU-heavy visitor from 1 worker to every core"""
+	elements = ObjectStructure([House(), Apartment(), Office()] * (count // 3))
+	cores = os.cpu_count() or 1
+	worker_counts = sorted({1, 2, 4, cores} | set(range(8, cores + 1, 8)))
+
+	start = time.perf_counter()
+	serial = functools.reduce(operator.add, EnergyModel().visit_all(list(elements)))
+	serial_time = time.perf_counter() - start
+	print("serial      : {:.2f}s".format(serial_time))
+
+	for workers in worker_counts:
+		start = time.perf_counter()
+		total = elements.parallel_visit(EnergyModel(), operator.add, workers=workers, chunk_size=chunk_size)
+		elapsed = time.perf_counter() - start
+		assert abs(total - serial) < 1e-6 * abs(serial)
+		print("{:2} worker(s): {:.2f}s, speed-up {:.2f}x ({} cores available)".format(workers, elapsed, serial_time / elapsed, cores))
+
+# Benchmark (run with: python Visitor.py --bench)
+if __name__ == "__main__" and "--bench" in sys.argv:
+	benchmark_dispatch_visitor()
+	benchmark_fused_visitors()
+	benchmark_parallel_visit()
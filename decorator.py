@@ -23,7 +23,18 @@
     the decorator class and add specific functionalities to the wrapped component."""
 
 
-from functools import wraps
+import asyncio
+import inspect
+import itertools
+import sys
+import threading
+import time
+import timeit
+import tracemalloc
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
 
 def make_blink(function):
 	"""Defines the decorator"""
@@ -57,6 +68,461 @@ print(hello_world.__name__)
 #Check if the docstring is still the same as that of the function being decorated
 print(hello_world.__doc__)
 
+"""Memoization:
+    A decorator can also remember what a pure function returned. memoize() is a
+    family of such decorators with more knobs than functools.lru_cache:
+        policy="lru" drops the least recently used result when the cache is full,
+        policy="lfu" the least frequently used one (ties go to the least recent);
+        ttl=seconds lets results expire, max_bytes caps the total size of the
+        cached results (as measured by sizeof, sys.getsizeof by default).
+    Concurrent calls with the same arguments are computed once ("single flight"):
+    the other callers wait for that result instead of computing it again, in
+    threads as well as in coroutines, since async functions are supported too.
+    wrapper.cache_info() returns the hit/miss/eviction statistics."""
+
+_KWARGS_MARK = object() #Separates positional from keyword arguments in cache keys
+
+def _cache_key(args, kwargs, typed):
+	key = args
+	items = tuple(sorted(kwargs.items())) if kwargs else ()
+	if items:
+		key += (_KWARGS_MARK,) + items
+	if typed: #Types in the same (sorted) order as the values, whatever order the keywords were passed in
+		key += tuple(type(value) for value in args) + tuple(type(value) for _, value in items)
+	return key
+
+class _Flight:
+	"""One computation that other callers with the same key can wait for"""
+	__slots__ = ("done", "value", "error")
+
+	def __init__(self):
+		self.done = None #Event, only created once a second caller has to wait for it
+		self.value = None
+		self.error = None
+
+class _MemoCache:
+	"""The storage behind one memoize()d function. Every operation, eviction included, is O(1):
+	expiry order and use counts are kept in their own structures instead of being searched for."""
+
+	def __init__(self, maxsize, policy, ttl, max_bytes, sizeof):
+		if policy not in ("lru", "lfu"):
+			raise ValueError("policy must be 'lru' or 'lfu', not {!r}".format(policy))
+		self.maxsize = maxsize
+		self.policy = policy
+		self.ttl = ttl
+		self.max_bytes = max_bytes
+		self.sizeof = sizeof
+		self.lock = threading.Lock()
+		self.entries = OrderedDict() #key -> [value, expires at, size, uses], least recently used first
+		self.expiry = OrderedDict() #key -> expires at; one ttl for all, so storing order is expiry order
+		self.frequencies = {} #uses -> OrderedDict of the keys used that often, least recently first (lfu)
+		self.min_uses = 0 #Smallest key of frequencies
+		self.flights = {} #key -> _Flight (threads) or asyncio.Task (coroutines)
+		self.clear()
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.expiry.clear()
+			self.frequencies.clear()
+			self.min_uses = 0
+			self.bytes = 0
+			self.hits = self.misses = self.evictions = self.expirations = self.coalesced = 0
+
+	def lookup(self, key):
+		"""Return (True, value) on a hit, (False, None) on a miss. Call with the lock held."""
+		entry = self.entries.get(key)
+		if entry is not None:
+			if self.ttl is not None and entry[1] <= time.monotonic():
+				self._remove(key)
+				self.expirations += 1
+			else:
+				if self.policy == "lru":
+					self.entries.move_to_end(key)
+				else:
+					self._used(key, entry)
+				self.hits += 1
+				return True, entry[0]
+		return False, None
+
+	def _used(self, key, entry):
+		"""Move key from its use count's bucket to the next one"""
+		uses = entry[3]
+		bucket = self.frequencies[uses]
+		del bucket[key]
+		if not bucket:
+			del self.frequencies[uses]
+			if self.min_uses == uses:
+				self.min_uses = uses + 1
+		entry[3] = uses + 1
+		self.frequencies.setdefault(uses + 1, OrderedDict())[key] = None
+
+	def store(self, key, value):
+		"""Remember a result and evict whatever no longer fits. Call with the lock held."""
+		size = self.sizeof(value) if self.max_bytes is not None else 0
+		if (self.max_bytes is not None and size > self.max_bytes) or self.maxsize == 0:
+			return #Would never fit
+		if key in self.entries:
+			self._remove(key)
+		#Make room first, so the result being stored can't be chosen as the victim
+		while self.entries and ((self.maxsize is not None and len(self.entries) >= self.maxsize) or
+				(self.max_bytes is not None and self.bytes + size > self.max_bytes)):
+			self._remove(self._victim())
+			self.evictions += 1
+		expires = time.monotonic() + self.ttl if self.ttl is not None else None
+		self.entries[key] = [value, expires, size, 1]
+		if self.ttl is not None:
+			self.expiry[key] = expires
+		if self.policy == "lfu":
+			self.frequencies.setdefault(1, OrderedDict())[key] = None
+			self.min_uses = 1
+		self.bytes += size
+
+	def _victim(self):
+		if self.ttl is not None: #Anything already expired goes first: the oldest stored expires first
+			key, expires = next(iter(self.expiry.items()))
+			if expires <= time.monotonic():
+				return key
+		if self.policy == "lfu":
+			return next(iter(self.frequencies[self.min_uses]))
+		return next(iter(self.entries))
+
+	def _remove(self, key):
+		entry = self.entries.pop(key)
+		self.bytes -= entry[2]
+		if self.ttl is not None:
+			del self.expiry[key]
+		if self.policy == "lfu":
+			uses = entry[3]
+			bucket = self.frequencies[uses]
+			del bucket[key]
+			if not bucket:
+				del self.frequencies[uses]
+				if uses == self.min_uses and self.frequencies:
+					self.min_uses = min(self.frequencies) #Only over the distinct use counts, not the entries
+
+	def info(self):
+		with self.lock:
+			return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+			        "evictions": self.evictions, "expirations": self.expirations,
+			        "entries": len(self.entries), "bytes": self.bytes}
+
+def memoize(maxsize=128, policy="lru", ttl=None, max_bytes=None, sizeof=sys.getsizeof, typed=False):
+	"""Defines a caching decorator for pure functions (plain or async)"""
+
+	def decorate(function):
+		cache = _MemoCache(maxsize, policy, ttl, max_bytes, sizeof)
+
+		if inspect.iscoroutinefunction(function):
+			async def compute(key, args, kwargs):
+				try:
+					value = await function(*args, **kwargs)
+					with cache.lock:
+						cache.store(key, value)
+					return value
+				finally:
+					with cache.lock:
+						cache.flights.pop(key, None)
+
+			@wraps(function)
+			async def decorator(*args, **kwargs):
+				key = _cache_key(args, kwargs, typed)
+				with cache.lock:
+					hit, value = cache.lookup(key)
+					if hit:
+						return value
+					flight = cache.flights.get(key)
+					if flight is None:
+						cache.misses += 1
+						#The computation is a task of its own that every caller awaits, the first one too
+						flight = cache.flights[key] = asyncio.ensure_future(compute(key, args, kwargs))
+						flight.add_done_callback(lambda task: task.cancelled() or task.exception()) #Retrieved, even if nobody waits any more
+					else:
+						cache.coalesced += 1
+				#shield() so a cancelled caller does not cancel the computation for the others
+				return await asyncio.shield(flight)
+		else:
+			@wraps(function)
+			def decorator(*args, **kwargs):
+				key = _cache_key(args, kwargs, typed)
+				with cache.lock:
+					hit, value = cache.lookup(key)
+					if hit:
+						return value
+					flight = cache.flights.get(key)
+					if flight is None:
+						cache.misses += 1
+						flight = cache.flights[key] = _Flight()
+						leader = True
+					else:
+						cache.coalesced += 1
+						leader = False
+						if flight.done is None:
+							flight.done = threading.Event()
+				if not leader:
+					flight.done.wait() #Someone else is already computing it
+					if flight.error is not None:
+						raise flight.error
+					return flight.value
+
+				try:
+					flight.value = function(*args, **kwargs)
+				except BaseException as e:
+					flight.error = e
+					raise
+				finally:
+					with cache.lock: #One lock round for both: nobody can join the flight after this
+						cache.flights.pop(key, None)
+						if flight.error is None:
+							cache.store(key, flight.value)
+						done = flight.done
+					if done is not None:
+						done.set()
+				return flight.value
+
+		decorator.cache_info = cache.info
+		decorator.cache_clear = cache.clear
+		return decorator
+
+	return decorate
+
+#Apply the caching decorator here!
+@memoize(maxsize=2, ttl=60)
+def slow_square(number):
+	"""Pretends to be expensive"""
+	time.sleep(0.1)
+	return number * number
+
+#Four threads ask for the same square at once: it's computed only once
+with ThreadPoolExecutor(max_workers=4) as pool:
+	print(list(pool.map(slow_square, [3, 3, 3, 3])))
+
+slow_square(4)
+slow_square(5) #The cache holds 2 results, so 3 (least recently used) is evicted
+print(slow_square.__name__, slow_square.cache_info())
+
+"""Profiling decorators:
+    profiled() measures the wall time and the CPU time (of the calling thread) of
+    the decorated function and, with memory=True, how much more memory tracemalloc
+    sees after the call than before (this starts tracemalloc, which slows every
+    allocation down, so only use it while investigating). With sample=n only every
+    n-th call is measured; the others just count, so it can stay switched on in
+    production. The measurements of all decorated functions are collected in this
+    process and profile_report() returns them."""
+
+_profiles = weakref.WeakKeyDictionary() #Decorated function -> _Profile (gone with the function)
+
+class _Profile:
+	"""Aggregated measurements of one profiled function"""
+
+	def __init__(self, name, sample, memory, last_call):
+		self.name = name
+		self.sample = sample
+		self.memory = memory
+		self._last_call = last_call #Returns the number the latest call took
+		self.lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		self.first = self._last_call() #Calls are counted from here on
+		self.measured = 0
+		self.wall_total = self.cpu_total = self.alloc_total = 0
+		self.wall_max = self.alloc_max = 0
+
+	@property
+	def calls(self):
+		return self._last_call() - self.first
+
+	def record(self, wall, cpu, alloc):
+		with self.lock:
+			self.measured += 1
+			self.wall_total += wall
+			self.cpu_total += cpu
+			self.alloc_total += alloc
+			self.wall_max = max(self.wall_max, wall)
+			self.alloc_max = max(self.alloc_max, alloc)
+
+	def summary(self):
+		measured = self.measured or 1
+		return {"function": self.name, "calls": self.calls, "measured": self.measured,
+		        "wall_mean_us": self.wall_total / measured / 1e3, "wall_max_us": self.wall_max / 1e3,
+		        "cpu_mean_us": self.cpu_total / measured / 1e3,
+		        "alloc_mean_bytes": self.alloc_total / measured if self.memory else None,
+		        "alloc_max_bytes": self.alloc_max if self.memory else None,
+		        "wall_total_s_estimated": self.wall_total / measured * self.calls / 1e9}
+
+def profiled(sample=1, memory=False):
+	"""Defines a decorator that measures every `sample`-th call of the function"""
+
+	def decorate(function):
+		counter = itertools.count(1) #Every call takes a number, only multiples of sample are measured
+		last = 0
+
+		def last_call():
+			return last
+
+		profile = _Profile("{}.{}".format(function.__module__, function.__qualname__), sample, memory, last_call)
+
+		@wraps(function)
+		def decorator(*args, **kwargs):
+			nonlocal last
+			last = number = next(counter) #A closure cell: cheaper to write than an attribute
+			if number % sample: #Not this time: the cost is one counter step
+				return function(*args, **kwargs)
+
+			if memory and not tracemalloc.is_tracing():
+				tracemalloc.start()
+			before = tracemalloc.get_traced_memory()[0] if memory else 0
+			cpu = time.thread_time_ns()
+			wall = time.perf_counter_ns()
+			try:
+				return function(*args, **kwargs)
+			finally:
+				wall = time.perf_counter_ns() - wall
+				cpu = time.thread_time_ns() - cpu
+				alloc = tracemalloc.get_traced_memory()[0] - before if memory else 0
+				profile.record(wall, cpu, alloc)
+
+		decorator.profile = profile
+		_profiles[decorator] = profile #The same name decorated twice gets two profiles, not one
+		return decorator
+
+	return decorate
+
+def profile_report(top=None, sort="wall_total_s_estimated"):
+	"""Summaries of every profiled function, the most expensive first"""
+	rows = sorted((profile.summary() for profile in _profiles.values()), key=lambda row: row[sort], reverse=True)
+	return rows[:top] if top is not None else rows
+
+def print_profile_report(top=10, file=None):
+	for row in profile_report(top):
+		alloc = "" if row["alloc_mean_bytes"] is None else " | alloc mean {:.0f} B max {} B".format(row["alloc_mean_bytes"], row["alloc_max_bytes"])
+		print("{:32} {:8} calls ({} measured) | wall mean {:9.2f} us max {:9.2f} us | cpu mean {:9.2f} us{}".format(
+			row["function"], row["calls"], row["measured"], row["wall_mean_us"], row["wall_max_us"], row["cpu_mean_us"], alloc), file=file)
+
+def profile_reset():
+	for profile in _profiles.values():
+		profile.reset()
+
+def profile_remove(function):
+	"""Take a profiled function out of the report"""
+	_profiles.pop(function, None)
+
+#Apply the profiling decorators here!
+tracing = tracemalloc.is_tracing() #memory=True starts tracemalloc if nobody has yet
+@profiled(sample=10)
+def build_greeting(name):
+	return "Hello, {}!".format(name)
+
+@profiled(memory=True)
+def build_table(size):
+	return [[0] * size for _ in range(size)]
+
+for i in range(1000):
+	build_greeting("World")
+build_table(100)
+print_profile_report()
+if not tracing:
+	tracemalloc.stop() #Only if the demo started it
+
+"""Compiled decorators:
+    Every make_blink-style layer is another Python frame, and the general version
+    with def decorator(*args, **kwargs) also packs and unpacks the arguments each
+    time. lightweight() builds decorators whose work is a hook called before the
+    function (with the same arguments) and/or a hook applied to its result. For
+    these it writes the source of a wrapper with the exact signature of the
+    decorated function and compiles it, so the wrapper passes its arguments on by
+    name. Stacked lightweight decorators fuse: decorating such a wrapper again
+    compiles one new wrapper around the original function that calls all the hooks,
+    so a stack of N costs one extra frame plus the hooks."""
+
+class _Source(str):
+	"""A name that shows up as itself in a printed signature (used for defaults)"""
+
+	def __repr__(self):
+		return self
+
+def _compile_wrapper(function, befores, afters):
+	"""Writes and compiles a wrapper with the signature of function calling the hooks"""
+	signature = inspect.signature(function)
+	prefix = "_fused_"
+	while any(name.startswith(prefix) for name in signature.parameters):
+		prefix += "_"
+
+	namespace = {prefix + "function": function}
+	parameters, call = [], []
+	for parameter in signature.parameters.values():
+		if parameter.default is not parameter.empty: #Defaults are looked up in the namespace, not printed
+			namespace[prefix + "default_" + parameter.name] = parameter.default
+			parameter = parameter.replace(default=_Source(prefix + "default_" + parameter.name))
+		parameters.append(parameter.replace(annotation=parameter.empty))
+		if parameter.kind is parameter.VAR_POSITIONAL:
+			call.append("*" + parameter.name)
+		elif parameter.kind is parameter.KEYWORD_ONLY:
+			call.append("{0}={0}".format(parameter.name))
+		elif parameter.kind is parameter.VAR_KEYWORD:
+			call.append("**" + parameter.name)
+		else:
+			call.append(parameter.name)
+	call = ", ".join(call)
+
+	coroutine = inspect.iscoroutinefunction(function)
+	name = function.__name__ if function.__name__.isidentifier() else "wrapper"
+	lines = ["{}def {}{}:".format("async " if coroutine else "", name, signature.replace(parameters=parameters, return_annotation=signature.empty))]
+	for index, hook in enumerate(befores):
+		namespace["{}before{}".format(prefix, index)] = hook
+		lines.append("\t{}before{}({})".format(prefix, index, call))
+	result = "{}{}function({})".format("await " if coroutine else "", prefix, call)
+	for index, hook in enumerate(afters):
+		namespace["{}after{}".format(prefix, index)] = hook
+		result = "{}after{}({})".format(prefix, index, result)
+	lines.append("\treturn " + result)
+
+	exec(compile("\n".join(lines), "<lightweight {}>".format(function.__qualname__), "exec"), namespace)
+	return namespace[name]
+
+_lightweight_wrappers = weakref.WeakSet() #The wrappers lightweight() compiled, the only ones it fuses with
+
+def lightweight(before=None, after=None):
+	"""Defines a decorator that calls before(*arguments) first and returns after(result)"""
+
+	def decorate(function):
+		#wraps() copies __fused__ onto other decorators' wrappers too: only fuse with our own
+		original, befores, afters = function.__fused__ if function in _lightweight_wrappers else (function, (), ())
+		#The outer decorator runs first and sees the result last, as with nested wrappers
+		befores = ((before,) if before else ()) + befores
+		afters = afters + ((after,) if after else ())
+
+		decorator = wraps(function)(_compile_wrapper(original, befores, afters))
+		decorator.__wrapped__ = original
+		decorator.__fused__ = (original, befores, afters)
+		_lightweight_wrappers.add(decorator)
+		return decorator
+
+	return decorate
+
+#Define decorators whose work fits in a hook
+blink = lightweight(after=lambda text: "<blink>" + text + "</blink>")
+bold = lightweight(after=lambda text: "<b>" + text + "</b>")
+
+def _check_name(name, punctuation="!", *, times=1):
+	if not name:
+		raise ValueError("greet() needs a name")
+
+#Apply the stacked decorators here!
+@blink
+@bold
+@lightweight(before=_check_name)
+def greet(name, punctuation="!", *, times=1):
+	"""Original function with arguments! """
+
+	return ("Hello, " + name + punctuation) * times
+
+#Check the result, the signature and that the three decorators became one wrapper
+print(greet("World"), greet("Decorators", times=2))
+print(greet.__name__, inspect.signature(greet), greet.__doc__)
+print("Wrapped function is itself a wrapper:", hasattr(greet.__wrapped__, "__wrapped__"))
+
 """ChatGPT Example:
     Let's take an example of a coffee shop, where we have a basic coffee and decorators
     to add toppings like milk, sugar, and chocolate.
@@ -74,24 +540,84 @@ class BasicCoffee(Coffee):
 
 # Decorator
 class CoffeeDecorator(Coffee):
+    """Concrete decorators say what they add in add_cost(); cost() then walks the chain in a loop
+    instead of recursing once per layer, so chains of any depth work. Each layer caches its result
+    until something inside its own chain is re-wrapped (by assigning to _coffee). Layers that still
+    override cost() are asked every time, and nothing above them is cached."""
+
     def __init__(self, coffee):
+        self._wrappers = None  # Weak references to the decorators wrapping this one, created when needed
         self._coffee = coffee
 
+    @property
+    def _coffee(self):
+        return self._wrapped
+
+    @_coffee.setter
+    def _coffee(self, coffee):
+        old = getattr(self, "_wrapped", None)
+        if isinstance(old, CoffeeDecorator) and old._wrappers:
+            old._wrappers = [ref for ref in old._wrappers if ref() not in (self, None)]
+        self._wrapped = coffee
+        if isinstance(coffee, CoffeeDecorator):
+            if coffee._wrappers is None:
+                coffee._wrappers = []
+            coffee._wrappers.append(weakref.ref(self))
+        self._invalidate()
+
+    def _invalidate(self):
+        """Forget the cached cost of this layer and of every layer wrapping it, and only those"""
+        self._cached = None
+        stack = [self]
+        while stack:
+            layer = stack.pop()
+            if not layer._wrappers:
+                continue
+            layer._wrappers = [ref for ref in layer._wrappers if ref() is not None]
+            for ref in layer._wrappers:
+                outer = ref()
+                if outer is not None and outer._cached is not None:  # A layer without a cache has none above it either
+                    outer._cached = None
+                    stack.append(outer)
+
+    def add_cost(self, cost):
+        """What this layer does to the cost of what it wraps (nothing, by default)"""
+        return cost
+
     def cost(self):
-        return self._coffee.cost()
+        layers, node = [], self
+        # Walk inwards until a layer that already knows its cost (or the bottom of the chain)
+        while isinstance(node, CoffeeDecorator) and type(node).cost is CoffeeDecorator.cost:
+            if node._cached is not None:
+                total = node._cached
+                break
+            layers.append(node)
+            node = node._wrapped
+        else:
+            total = node.cost()
+            if isinstance(node, CoffeeDecorator):
+                # A layer with its own cost() may answer differently next time: don't cache on top of it
+                for layer in reversed(layers):
+                    total = layer.add_cost(total)
+                return total
+        # Then fold the costs back outwards, remembering each layer's result
+        for layer in reversed(layers):
+            total = layer.add_cost(total)
+            layer._cached = total
+        return total
 
 # Concrete Decorators
 class MilkDecorator(CoffeeDecorator):
-    def cost(self):
-        return self._coffee.cost() + 5
+    def add_cost(self, cost):
+        return cost + 5
 
 class SugarDecorator(CoffeeDecorator):
-    def cost(self):
-        return self._coffee.cost() + 2
+    def add_cost(self, cost):
+        return cost + 2
 
 class ChocolateDecorator(CoffeeDecorator):
-    def cost(self):
-        return self._coffee.cost() + 3
+    def add_cost(self, cost):
+        return cost + 3
 
 # Usage
 my_coffee = BasicCoffee()
@@ -101,8 +627,113 @@ my_coffee_with_all_toppings = ChocolateDecorator(my_coffee_with_milk_sugar)
 print("Cost of Basic Coffee:", my_coffee.cost())  # Output: 10
 print("Cost with Milk and Sugar:", my_coffee_with_milk_sugar.cost())  # Output: 17 (10 + 5 + 2)
 print("Cost with All Toppings:", my_coffee_with_all_toppings.cost())  # Output: 20 (10 + 5 + 2 + 3)
+
+# Chains can be as deep as an order needs: no recursion, and the cost is only folded once
+big_order = my_coffee
+for _ in range(10000):
+    big_order = SugarDecorator(big_order)
+print("Cost with 10000 Sugars:", big_order.cost())  # Output: 20010
+
+# Re-wrapping a layer invalidates the cached costs of the chains it is part of
+my_coffee_with_milk_sugar._coffee = BasicCoffee()
+my_coffee_with_milk_sugar._coffee = ChocolateDecorator(my_coffee)
+print("Cost with All Toppings after re-wrapping:", my_coffee_with_all_toppings.cost())  # Output: 21 (10 + 3 + 5 + 3)
 """
     In this example, Coffee is the component interface, BasicCoffee is the concrete component,
     CoffeeDecorator is the abstract decorator, and MilkDecorator, SugarDecorator, and ChocolateDecorator
     are concrete decorators. Each decorator adds its specific cost to the wrapped component's cost, 
     effectively enhancing the functionality of the basic coffee object."""
+
+
+def benchmark_coffee_chains(depths=(10, 1000, 100000), repeat=100):
+    """Price queries on chains of different depths: one recursive call per layer vs CoffeeDecorator.cost()"""
+    def recursive_cost(coffee):  # How cost() used to work: one Python frame per layer
+        if isinstance(coffee, CoffeeDecorator):
+            return coffee.add_cost(recursive_cost(coffee._coffee))
+        return coffee.cost()
+
+    for depth in depths:
+        order = BasicCoffee()
+        for i in range(depth):
+            order = (MilkDecorator, SugarDecorator, ChocolateDecorator)[i % 3](order)
+
+        try:
+            recursive = "{:10.1f} us".format(min(timeit.repeat(lambda: recursive_cost(order), number=1, repeat=5)) * 1e6)
+        except RecursionError:
+            recursive = "RecursionError"
+
+        first = timeit.timeit(order.cost, number=1)
+        cached = timeit.timeit(order.cost, number=repeat) / repeat
+        print("depth {:6}: recursive {:>14} | first cost() {:10.1f} us | cached cost() {:6.2f} us".format(
+            depth, recursive, first * 1e6, cached * 1e6))
+
+def benchmark_memoize(maxsize=50000, misses=20000):
+	"""Cost of a miss in a full cache (store + eviction): functools.lru_cache vs memoize() variants"""
+	def identity(value):
+		return value
+
+	variants = (("functools.lru_cache", lru_cache(maxsize=maxsize)(identity)),
+	            ("memoize() lru", memoize(maxsize=maxsize)(identity)),
+	            ("memoize(ttl=3600)", memoize(maxsize=maxsize, ttl=3600)(identity)),
+	            ("memoize(policy='lfu')", memoize(maxsize=maxsize, policy="lfu")(identity)),
+	            ("memoize(max_bytes=...)", memoize(maxsize=None, max_bytes=maxsize * sys.getsizeof(maxsize))(identity)))
+	for label, cached in variants:
+		for value in range(maxsize): #Fill it up, then every new value evicts one
+			cached(value)
+		fresh = iter(range(maxsize, maxsize + misses * 5))
+		best = min(timeit.repeat(lambda: cached(next(fresh)), number=misses, repeat=5)) / misses
+		print("{:24}: {:6.2f} us per miss at capacity".format(label, best * 1e6))
+
+def benchmark_profiled(calls=1000000):
+	"""Per-call overhead of profiled() on a trivial function, with and without sampling"""
+	def work(value):
+		return value
+
+	def plain_wrapper(function): #The make_blink way, with arguments
+		@wraps(function)
+		def decorator(*args, **kwargs):
+			return function(*args, **kwargs)
+		return decorator
+
+	variants = (("undecorated", work), ("plain *args wrapper", plain_wrapper(work)),
+	            ("profiled(sample=1000)", profiled(sample=1000)(work)), ("profiled(sample=100)", profiled(sample=100)(work)),
+	            ("profiled(sample=1)", profiled(sample=1)(work)))
+	baseline = None
+	for label, function in variants:
+		best = min(timeit.repeat(lambda: function(1), number=calls, repeat=5)) / calls * 1e9
+		baseline = best if baseline is None else baseline
+		print("{:22}: {:6.0f} ns per call (+{:.0f} ns)".format(label, best, best - baseline))
+		profile_remove(function) #Don't leave the benchmark's functions in the report
+
+def benchmark_lightweight(depths=(1, 5, 10), calls=200000):
+	"""Call overhead of N stacked decorators: nested *args wrappers against one fused wrapper"""
+	def work(value, scale=1, *, offset=0):
+		return value * scale + offset
+
+	def touch(result):
+		return result
+
+	def nested(function): #The make_blink way, with arguments and the same hook
+		@wraps(function)
+		def decorator(*args, **kwargs):
+			return touch(function(*args, **kwargs))
+		return decorator
+
+	bare = min(timeit.repeat(lambda: work(1, 2, offset=3), number=calls, repeat=5)) / calls * 1e9
+	print("undecorated     : {:6.0f} ns per call".format(bare))
+	for depth in depths:
+		naive, fused = work, work
+		for _ in range(depth):
+			naive = nested(naive)
+			fused = lightweight(after=touch)(fused)
+		assert naive(1, 2, offset=3) == fused(1, 2, offset=3) == 5
+		timings = [min(timeit.repeat(lambda: function(1, 2, offset=3), number=calls, repeat=5)) / calls * 1e9 for function in (naive, fused)]
+		print("stack of {:2}     : nested {:6.0f} ns (+{:5.0f}) | fused {:6.0f} ns (+{:5.0f})".format(
+			depth, timings[0], timings[0] - bare, timings[1], timings[1] - bare))
+
+# Benchmark (run with: python decorator.py --bench)
+if __name__ == "__main__" and "--bench" in sys.argv:
+    benchmark_coffee_chains()
+    benchmark_memoize()
+    benchmark_profiled()
+    benchmark_lightweight()